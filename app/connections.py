@@ -0,0 +1,490 @@
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Optional, Set, Union
+from fastapi import WebSocket
+from .protocol import Event, encode_json, encode_msgpack, to_event
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Clients that never subscribe keep receiving everything
+WILDCARD_TOPIC = "*"
+
+# Live-only events: delivered to connected clients but kept out of the replay rings, so a burst of
+# streaming chunks never pushes the responses they lead up to out of a reconnecting client's reach
+TRANSIENT_EVENTS = {"agent_delta"}
+
+# Events whose newer copy supersedes a queued older one under the "coalesce" overflow policy.
+# Everything else (responses, deltas, errors, session start/end) carries content of its own and is never merged.
+SUPERSEDING_EVENTS = {"system_notice", "ping", "subscribed"}
+
+def event_topics(message: Dict[str, Any]) -> List[str]:
+    """Topics an event belongs to, derived from its thread and session_id."""
+    topics = []
+    if message.get("thread"):
+        topics.append(f"thread:{message['thread']}")
+    if message.get("session_id"):
+        topics.append(f"session:{message['session_id']}")
+    return topics
+
+class Frame:
+    """An event shared by every queue and replay ring it is placed in; each wire encoding is built at most once."""
+
+    __slots__ = ("seq", "event_type", "key", "event", "_json", "_msgpack", "_sse")
+
+    def __init__(self, seq: Optional[int], event_type: Optional[str], key: Hashable, event: Union[Event, Dict[str, Any]]):
+        self.seq = seq
+        self.event_type = event_type
+        self.key = key
+        self.event = event
+        self._json: Optional[str] = None
+        self._msgpack: Optional[bytes] = None
+        self._sse: Optional[str] = None
+
+    @property
+    def payload(self) -> str:
+        """JSON text encoding."""
+        if self._json is None:
+            self._json = encode_json(self.event)
+        return self._json
+
+    @property
+    def msgpack(self) -> bytes:
+        """MessagePack encoding for clients that negotiated binary frames."""
+        if self._msgpack is None:
+            self._msgpack = encode_msgpack(self.event)
+        return self._msgpack
+
+    @property
+    def sse(self) -> str:
+        """Server-Sent Events encoding, built once and reused for every observer."""
+        if self._sse is None:
+            lines = []
+            if self.seq is not None:
+                lines.append(f"id: {self.seq}")
+            if self.event_type:
+                lines.append(f"event: {self.event_type}")
+            lines.append(f"data: {self.payload}")
+            self._sse = "\n".join(lines) + "\n\n"
+        return self._sse
+
+class ReplayRing:
+    """Bounded history of frames for one topic, remembering what it has evicted."""
+
+    def __init__(self, size: int):
+        self.items: Deque[Frame] = deque(maxlen=size)
+        self.evicted_through = 0  # highest seq no longer available
+
+    def append(self, frame: Frame):
+        if len(self.items) == self.items.maxlen:
+            self.evicted_through = self.items[0].seq
+        self.items.append(frame)
+
+    def since(self, seq: int) -> List[Frame]:
+        """Frames newer than seq (scans from the newest end)."""
+        newer = []
+        for frame in reversed(self.items):
+            if frame.seq <= seq:
+                break
+            newer.append(frame)
+        newer.reverse()
+        return newer
+
+class ClientConnection:
+    """One WebSocket client with its own bounded outbound queue and writer task."""
+
+    def __init__(self, websocket: Optional[WebSocket], client_id: str, max_queue: int, overflow_policy: str):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.queue: Deque[Frame] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer_task: Optional[asyncio.Task] = None
+        self.topics: Set[str] = {WILDCARD_TOPIC}
+        self.encoding = "json"
+        self.last_seen = time.monotonic()
+
+        # Metrics
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth_seen = 0
+
+    def touch(self):
+        """Record inbound activity (any frame, including pong)."""
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Queue a frame without blocking. Returns False if the client should be disconnected."""
+        if self.closed:
+            return True
+
+        if len(self.queue) >= self.max_queue:
+            if self.overflow_policy == "disconnect":
+                return False
+            if self.overflow_policy == "coalesce" and self._coalesce(frame):
+                return True
+            # drop_oldest, or coalesce with nothing to merge into
+            self.queue.popleft()
+            self.dropped += 1
+
+        self.queue.append(frame)
+        self.max_depth_seen = max(self.max_depth_seen, len(self.queue))
+        self.ready.set()
+        return True
+
+    def _coalesce(self, frame: Frame) -> bool:
+        """Replace the newest queued frame sharing this key, keeping its queue position."""
+        if frame.key is None:
+            return False
+        for index in range(len(self.queue) - 1, -1, -1):
+            if self.queue[index].key == frame.key:
+                self.queue[index] = frame
+                self.coalesced += 1
+                return True
+        return False
+
+    async def run_writer(self, manager: "ConnectionManager"):
+        """Drain the queue to the socket until the client goes away."""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+
+                frame = self.queue.popleft()
+                if self.encoding == "msgpack":
+                    await self.websocket.send_bytes(frame.msgpack)
+                else:
+                    await self.websocket.send_text(frame.payload)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to send message to client {self.client_id}: {e}")
+            manager.disconnect(self.websocket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and delivery counters for this client."""
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth_seen,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "idle_seconds": round(time.monotonic() - self.last_seen, 1),
+            "encoding": self.encoding,
+            "topics": sorted(self.topics)
+        }
+
+class ObserverConnection(ClientConnection):
+    """A read-only subscriber (e.g. an SSE stream). Its queue is drained by the HTTP response, not a writer task."""
+
+    def __init__(self, client_id: str, max_queue: int, overflow_policy: str):
+        super().__init__(None, client_id, max_queue, overflow_policy)
+
+    def drain(self) -> str:
+        """Pop everything queued as one SSE chunk."""
+        chunk = "".join(frame.sse for frame in self.queue)
+        self.sent += len(self.queue)
+        self.queue.clear()
+        return chunk
+
+class ConnectionManager:
+    """Manages WebSocket connections and broadcasting."""
+
+    def __init__(self, max_queue: int = 256, overflow_policy: str = "drop_oldest",
+                 replay_size: int = 500, replay_max_topics: int = 1000, max_observers: int = 5000,
+                 max_connections: int = 1000, ping_interval: float = 20, idle_timeout: float = 60):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}. Use one of {OVERFLOW_POLICIES}")
+
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.max_connections = max_connections
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.rejected = 0
+        self.reaped = 0
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.observers: Set[ObserverConnection] = set()
+        self.max_observers = max_observers
+        self.topic_index: Dict[str, Set[ClientConnection]] = {}
+        self._ids = itertools.count(1)
+        self._closing: Set[asyncio.Task] = set()
+
+        # Every emitted event gets a monotonic seq and is kept per topic for resume-on-reconnect
+        self.seq = 0
+        self.replay_size = replay_size
+        self.replay_max_topics = replay_max_topics
+        self.replay_rings: "OrderedDict[str, ReplayRing]" = OrderedDict()
+
+    async def connect(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        """Accept a client, or reject it with 1013 (try again later) when at the connection limit."""
+        await websocket.accept()
+        if len(self.active_connections) >= self.max_connections:
+            self.rejected += 1
+            logger.warning(f"Rejecting WebSocket client: {self.max_connections} connections already open")
+            await self._close_quietly(websocket, "Server at connection limit", code=1013)
+            return None
+
+        client = ClientConnection(websocket, f"client_{next(self._ids)}", self.max_queue, self.overflow_policy)
+        client.writer_task = asyncio.create_task(client.run_writer(self))
+        self.active_connections[websocket] = client
+        self._index_add(client, WILDCARD_TOPIC)
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if not client:
+            return
+
+        for topic in client.topics:
+            self._index_remove(client, topic)
+        client.closed = True
+        client.queue.clear()
+        client.ready.set()
+        if client.writer_task and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+
+    def add_observer(self, topics: Iterable[str]) -> Optional[ObserverConnection]:
+        """Register a read-only subscriber. Returns None when the observer limit is reached."""
+        if len(self.observers) >= self.max_observers:
+            return None
+
+        observer = ObserverConnection(f"observer_{next(self._ids)}", self.max_queue, self.overflow_policy)
+        self.observers.add(observer)
+        self._index_add(observer, WILDCARD_TOPIC)
+        self.subscribe(observer, topics)
+        return observer
+
+    def remove_observer(self, observer: ObserverConnection):
+        if observer not in self.observers:
+            return
+
+        self.observers.discard(observer)
+        for topic in observer.topics:
+            self._index_remove(observer, topic)
+        observer.closed = True
+        observer.queue.clear()
+        observer.ready.set()
+
+    def _evict(self, client: ClientConnection, reason: str, code: int = 1008):
+        """Drop a client that cannot keep up and close its socket in the background."""
+        logger.warning(f"Disconnecting {client.client_id}: {reason}")
+        if isinstance(client, ObserverConnection):
+            self.remove_observer(client)
+            return
+
+        self.disconnect(client.websocket)
+
+        task = asyncio.create_task(self._close_quietly(client.websocket, reason, code=code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _index_add(self, client: ClientConnection, topic: str):
+        self.topic_index.setdefault(topic, set()).add(client)
+
+    def _index_remove(self, client: ClientConnection, topic: str):
+        subscribers = self.topic_index.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(client)
+        if not subscribers:
+            del self.topic_index[topic]
+
+    def subscribe(self, client: ClientConnection, topics: Iterable[str]) -> List[str]:
+        """Subscribe a client to topics. The first explicit subscription replaces the wildcard."""
+        topics = [t for t in topics if isinstance(t, str) and t]
+        if not topics:
+            return sorted(client.topics)
+
+        if WILDCARD_TOPIC in client.topics and WILDCARD_TOPIC not in topics:
+            client.topics.discard(WILDCARD_TOPIC)
+            self._index_remove(client, WILDCARD_TOPIC)
+
+        for topic in topics:
+            client.topics.add(topic)
+            self._index_add(client, topic)
+        return sorted(client.topics)
+
+    def unsubscribe(self, client: ClientConnection, topics: Iterable[str]) -> List[str]:
+        """Remove topics from a client's subscriptions."""
+        for topic in topics:
+            if topic in client.topics:
+                client.topics.discard(topic)
+                self._index_remove(client, topic)
+        return sorted(client.topics)
+
+    def send_to(self, client: ClientConnection, message: Dict[str, Any]):
+        """Queue a message for a single client."""
+        frame = Frame(None, message.get("type"), self._coalesce_key(message), to_event(message))
+        if not client.enqueue(frame):
+            self._evict(client, "send queue overflow")
+
+    def _recipients(self, topics: List[str]) -> Iterable[ClientConnection]:
+        """Clients interested in these topics, looked up through the topic index."""
+        if not topics:
+            # Global events (e.g. errors without a thread) go to everyone
+            return list(self.active_connections.values()) + list(self.observers)
+
+        wildcard = self.topic_index.get(WILDCARD_TOPIC, ())
+        indexed = [self.topic_index[t] for t in topics if t in self.topic_index]
+        if not indexed:
+            return list(wildcard)
+        if len(indexed) == 1 and not wildcard:
+            return list(indexed[0])
+        return set(wildcard).union(*indexed)
+
+    async def _close_quietly(self, websocket: WebSocket, reason: str, code: int):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def start_heartbeat(self):
+        if self.ping_interval > 0 and self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop_heartbeat(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            await asyncio.gather(self.heartbeat_task, return_exceptions=True)
+            self.heartbeat_task = None
+
+    async def _heartbeat(self):
+        """Ping every client periodically and reap the ones that have gone silent."""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.reap_idle()
+            ping = {"type": "ping", "ts": int(time.time())}
+            for client in list(self.active_connections.values()):
+                self.send_to(client, ping)
+
+    def reap_idle(self) -> int:
+        """Disconnect clients with no inbound frame (pong or otherwise) within the idle timeout."""
+        if self.idle_timeout <= 0:
+            return 0
+
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [c for c in self.active_connections.values() if c.last_seen < cutoff]
+        for client in idle:
+            self._evict(client, "idle timeout", code=1001)
+        self.reaped += len(idle)
+        return len(idle)
+
+    @staticmethod
+    def _coalesce_key(message: Dict[str, Any]) -> Optional[Hashable]:
+        """Superseding events of the same type for the same session/thread and sender replace each other; None never merges."""
+        if message.get("type") not in SUPERSEDING_EVENTS:
+            return None
+        return (
+            message.get("type"),
+            message.get("session_id") or message.get("thread"),
+            message.get("sender")
+        )
+
+    def _ring(self, topic: str) -> ReplayRing:
+        """Replay ring for a topic; the least recently used rings are dropped past the topic cap."""
+        ring = self.replay_rings.get(topic)
+        if ring is None:
+            ring = self.replay_rings[topic] = ReplayRing(self.replay_size)
+            while len(self.replay_rings) > self.replay_max_topics:
+                self.replay_rings.popitem(last=False)
+        else:
+            self.replay_rings.move_to_end(topic)
+        return ring
+
+    def replay(self, client: ClientConnection, resume_from: int) -> int:
+        """Queue the events a reconnecting client missed since resume_from. Returns how many were sent."""
+        if resume_from > self.seq:
+            # Sequence numbers restarted (server restart): nothing we hold can be matched up
+            self.send_to(client, {
+                "type": "replay_gap",
+                "resume_from": resume_from,
+                "server_seq": self.seq,
+                "restarted": True,
+                "reason": "Server restarted",
+                "ts": int(time.time())
+            })
+            return 0
+
+        if WILDCARD_TOPIC in client.topics:
+            rings = list(self.replay_rings.values())
+        else:
+            rings = [self.replay_rings[t] for t in list(client.topics) + [WILDCARD_TOPIC] if t in self.replay_rings]
+
+        missed = {}
+        gap = False
+        for ring in rings:
+            if ring.evicted_through > resume_from:
+                gap = True
+            for frame in ring.since(resume_from):
+                missed[frame.seq] = frame
+
+        if gap:
+            self.send_to(client, {
+                "type": "replay_gap",
+                "resume_from": resume_from,
+                "server_seq": self.seq,
+                "reason": "Some events are older than the replay buffer",
+                "ts": int(time.time())
+            })
+
+        for seq in sorted(missed):
+            if not client.enqueue(missed[seq]):
+                self._evict(client, "send queue overflow during replay")
+                break
+        return len(missed)
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """Deliver a message to every client subscribed to its topics. Only enqueues; never waits on a socket."""
+        seq = message.get("seq")
+        if isinstance(seq, int):
+            # Already numbered by a cross-worker event bus
+            self.seq = max(self.seq, seq)
+        else:
+            self.seq += 1
+            seq = self.seq
+            message = {**message, "seq": seq}
+        frame = Frame(seq, message.get("type"), self._coalesce_key(message), to_event(message))
+
+        topics = event_topics(message)
+        if frame.event_type not in TRANSIENT_EVENTS:
+            for topic in topics or [WILDCARD_TOPIC]:
+                self._ring(topic).append(frame)
+
+        if not self.active_connections and not self.observers:
+            return
+
+        for client in self._recipients(topics):
+            if not client.enqueue(frame):
+                self._evict(client, "send queue overflow")
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Current outbound queue depth per client."""
+        return {client.client_id: len(client.queue) for client in self.active_connections.values()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-client queue metrics for the health endpoint."""
+        return {
+            "overflow_policy": self.overflow_policy,
+            "max_queue": self.max_queue,
+            "max_connections": self.max_connections,
+            "rejected_connections": self.rejected,
+            "reaped_idle": self.reaped,
+            "seq": self.seq,
+            "replay_topics": len(self.replay_rings),
+            "topics": {topic: len(subscribers) for topic, subscribers in self.topic_index.items()},
+            "clients": {client.client_id: client.stats() for client in self.active_connections.values()},
+            "observers": len(self.observers),
+            "max_observers": self.max_observers
+        }
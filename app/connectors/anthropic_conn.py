@@ -1,146 +1,246 @@
+import os
 import json
 import logging
+import time
 import asyncio
-from typing import Dict, Any, Union
+import inspect
+from typing import Dict, Any, List, Optional, Tuple, Union
 import anthropic
+from .rate_limit import RateLimiter, estimate_tokens
+from .envelope import EnvelopeParser
+from .resilience import Resilience, resilience_from_settings
+from .http_pool import ProviderPool
+from .base import AgentSpec, ConnectorReply, DeltaCallback, HandoffCallback, Usage, default_team, collaboration_prompt, collaboration_turn, single_mode_prompt
 
 logger = logging.getLogger(__name__)
 
 class AnthropicConnector:
-    """Connector for Anthropic's Claude API with collaboration support."""
+    """Connector for Anthropic's Claude models with collaboration support."""
     
-    def __init__(self, settings_manager):
+    def __init__(self, settings_manager, spec: Optional[AgentSpec] = None, peers: Optional[List[AgentSpec]] = None,
+                 next_agent: Optional[AgentSpec] = None, rate_limiter: Optional[RateLimiter] = None,
+                 resilience: Optional[Resilience] = None, http_pool: Optional[ProviderPool] = None):
         self.settings_manager = settings_manager
-        self.client = anthropic.AsyncAnthropic(
-            api_key=settings_manager.get_anthropic_key()
+        if spec is None:
+            spec, peers, next_agent = default_team("claude")
+        self.spec = spec
+        self.name = spec.name
+        self.model = spec.model
+        self.collaboration_max_tokens = spec.collaboration_max_tokens
+        self.stream = settings_manager.get("stream_responses", True)
+        self.prompt_caching = settings_manager.get("prompt_caching", True)
+        
+        api_key = os.getenv(spec.api_key_env) if spec.api_key_env else settings_manager.get_anthropic_key()
+        # A shared, pre-warmed connection pool when the registry provides one; otherwise the SDK's own client
+        pooled = {"http_client": http_pool.client, "timeout": http_pool.timeout} if http_pool else {}
+        client_args = {
+            "api_key": api_key,
+            "max_retries": 0  # retries are ours (self.resilience), paced by the shared rate limiter
+        }
+        try:
+            self.client = anthropic.AsyncAnthropic(**client_args, **pooled)
+        except TypeError as e:
+            if not pooled:
+                raise
+            logger.warning(f"anthropic SDK refused the shared connection pool ({e}); using its own client")
+            self.client = anthropic.AsyncAnthropic(**client_args)
+        # anthropic 1.x no longer takes temperature in messages.create; only send it to SDKs that do
+        create_params = inspect.signature(self.client.messages.create).parameters
+        self.sampling = {"temperature": spec.temperature} if "temperature" in create_params else {}
+        if not self.sampling:
+            logger.info(f"Agent {spec.name}: this anthropic SDK has no temperature parameter; using the model default")
+        self.rate_limiter = rate_limiter or RateLimiter(
+            "anthropic", settings_manager.get("anthropic_rpm", 0), settings_manager.get("anthropic_tpm", 0)
         )
+        self.resilience = resilience or resilience_from_settings("anthropic", settings_manager)
         
-        # Basic system prompt for single mode
-        self.base_system_prompt = """You are one of two assistants in a private room. Only speak when explicitly called.
-
-If you want the other assistant to help, respond **only** with strict JSON (no extra text):
-{ "handoff": { "to": "gpt", "task": "<one sentence>" } }
-
-If you are answering yourself, return normal text only (no JSON).
-Never cause more than one handoff per message.
-Your name is "claude" for the handoff.to field."""
-
-        # Collaboration system prompt
-        self.collaboration_prompt = """You are Claude, working collaboratively with ChatGPT on a shared goal.
-
-COLLABORATION RULES:
-- Respond with JSON in this exact format:
-{
-  "message": "Your response visible to everyone",
-  "handoff": {
-    "to": "gpt", 
-    "task": "Brief instruction for ChatGPT"
-  },
-  "final": false
-}
+        # Prompts name this agent's handoff targets and the agent that speaks after it
+        self.base_system_prompt = single_mode_prompt(spec, peers or [])
+        self.collaboration_prompt = collaboration_prompt(spec, peers or [], next_agent or spec)
+    
+    async def _create_message(self, system: str, user_content: str, max_tokens: int,
+                              on_delta: Optional[DeltaCallback] = None,
+                              cached_prefix: Optional[str] = None) -> ConnectorReply:
+        """One messages API call through the provider's retry/backoff/circuit-breaker layer.
 
-- "message" (required): Your contribution to the conversation
-- "handoff" (optional): Pass control to ChatGPT with a specific task
-- "final" (optional): Set to true if you think the goal is complete
+        Failed attempts are retried only until streamed text has been handed on, so nothing is shown twice.
+        """
+        streamed = False
+        
+        def forward(chunk: str):
+            nonlocal streamed
+            streamed = True
+            on_delta(chunk)
+        
+        return await self.resilience.call(
+            lambda reserved: self._request_message(
+                system, user_content, max_tokens, reserved, forward if on_delta else None, cached_prefix
+            ),
+            can_retry=lambda: not streamed,
+            admit=lambda: self.rate_limiter.acquire(estimate_tokens(system, cached_prefix or "", user_content) + max_tokens)
+        )
+    
+    async def _request_message(self, system: str, user_content: str, max_tokens: int, reserved: int,
+                               on_delta: Optional[DeltaCallback] = None,
+                               cached_prefix: Optional[str] = None) -> ConnectorReply:
+        """Call the messages API once, with `reserved` tokens of RPM/TPM budget already taken; returns the raw text.
 
-ROLE GUIDANCE:
-- You excel at: creative writing, analysis, synthesis, explanations, brainstorming
-- Keep responses concise (2-5 sentences) to maintain collaboration flow
-- In autopilot mode, focus on building upon previous responses
-- If no handoff needed, omit the "handoff" field (ChatGPT will take next turn automatically)
+        The system prompt and cached_prefix (sent ahead of user_content) are marked for prompt caching.
 
-RESPOND ONLY WITH VALID JSON."""
+        When streaming, each text delta goes to on_delta as it arrives; usage comes from the
+        message_start (input) and message_delta (output) events.
+        """
+        system_blocks, content = self._cacheable(system, cached_prefix, user_content)
+        started = time.perf_counter()
+        ttft_ms = None
+        parts: List[str] = []
+        accepted = False
+        try:
+            try:
+                raw = await self.client.messages.with_raw_response.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    **self.sampling,
+                    system=system_blocks,
+                    messages=[
+                        {"role": "user", "content": content}
+                    ],
+                    **({"stream": True} if self.stream else {})
+                )
+            except anthropic.RateLimitError as e:
+                self.rate_limiter.on_rate_limited(e.response.headers)
+                raise
+            accepted = True
+            
+            if self.stream:
+                model, start_usage, output_tokens = self.model, None, None
+                stream = await self._parse(raw)
+                try:
+                    async for event in stream:
+                        if event.type == "message_start":
+                            model = event.message.model or self.model
+                            start_usage = event.message.usage
+                        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                            if ttft_ms is None:
+                                ttft_ms = (time.perf_counter() - started) * 1000
+                            parts.append(event.delta.text)
+                            if on_delta:
+                                on_delta(event.delta.text)
+                        elif event.type == "message_delta":
+                            output_tokens = event.usage.output_tokens
+                finally:
+                    await stream.close()
+                text = "".join(parts)
+                usage = self._usage_from(model, start_usage, output_tokens) if start_usage else None
+            else:
+                response = await self._parse(raw)
+                usage = self._usage(response)
+                text = response.content[0].text
+        except BaseException:
+            # No usage will be reported (failed, rejected, cancelled by stop/allstop or the deadline):
+            # a rejected request used nothing, one broken off mid-reply the prompt and the text received
+            self.rate_limiter.settle(reserved, reserved - max_tokens + estimate_tokens(*parts) if accepted else 0)
+            raise
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        # A server that reports no usage is charged an estimate: the prompt plus the text it generated
+        self.rate_limiter.settle(reserved, usage.total_tokens if usage else reserved - max_tokens + estimate_tokens(text))
+        self.rate_limiter.update_from_headers(raw.headers)
+        return ConnectorReply(text, usage, ttft_ms if ttft_ms is not None else latency_ms, latency_ms)
+    
+    @staticmethod
+    async def _parse(raw: Any) -> Any:
+        """The body of a with_raw_response call; parse() is a coroutine in anthropic 1.x and plain in 0.x."""
+        parsed = raw.parse()
+        return await parsed if inspect.isawaitable(parsed) else parsed
+    
+    def _usage(self, response: Any) -> Optional[Usage]:
+        """Token counts from the API response, if it reported any."""
+        return self._usage_from(response.model, response.usage) if response.usage else None
     
-    async def process_message(self, text: str) -> Union[str, Dict[str, Any]]:
+    def _usage_from(self, model: Optional[str], usage: Any, output_tokens: Optional[int] = None) -> Usage:
+        # input_tokens excludes cache reads and writes; Usage counts every prompt token as input
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        return Usage(
+            "anthropic", model or self.model,
+            (usage.input_tokens or 0) + cache_read + cache_write,
+            output_tokens if output_tokens is not None else (usage.output_tokens or 0),
+            cache_read_tokens=cache_read,
+            cache_write_tokens=cache_write
+        )
+    
+    def _cacheable(self, system: str, cached_prefix: Optional[str], user_content: str) -> Tuple[Any, Any]:
+        """System prompt and user content, with cache breakpoints after the parts that repeat across calls."""
+        if not self.prompt_caching:
+            return system, (f"{cached_prefix}\n{user_content}" if cached_prefix else user_content)
+        system_blocks = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        if not cached_prefix:
+            return system_blocks, user_content
+        return system_blocks, [
+            {"type": "text", "text": cached_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": user_content}
+        ]
+    
+    def _parse_single(self, content: str) -> Union[str, Dict[str, Any]]:
+        """Single mode: a handoff JSON object, or plain text."""
+        # Try to parse as JSON (for handoffs)
+        try:
+            parsed = json.loads(content)
+            if "handoff" in parsed:
+                return parsed
+        except json.JSONDecodeError:
+            pass
+        
+        # Return as plain text
+        return content
+    
+    def _parse_collaboration(self, content: str, parser: Optional[EnvelopeParser] = None) -> Dict[str, Any]:
+        """Collaboration mode: the JSON envelope, what could be recovered of a broken one, or the raw text as its message."""
+        if parser is None or not parser.consumed:
+            # Not streamed: parse the whole reply at once
+            parser = EnvelopeParser()
+            parser.feed(content)
+        envelope = parser.envelope()
+        if parser.mode == "text":
+            logger.warning(f"Anthropic returned non-JSON in collaboration mode: {content}")
+        elif parser.recovered:
+            logger.warning(f"Anthropic returned an incomplete envelope in collaboration mode; recovered: {envelope}")
+        return envelope
+    
+    async def process_message(self, text: str, on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
         """Process a message in single mode."""
         try:
-            response = await self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                temperature=0.7,
-                system=self.base_system_prompt,
-                messages=[
-                    {"role": "user", "content": text}
-                ]
+            reply = await self._create_message(
+                self.base_system_prompt, text, max_tokens=self.spec.max_tokens, on_delta=on_delta
             )
             
-            content = response.content[0].text.strip()
-            
-            # Try to parse as JSON (for handoffs)
-            try:
-                parsed = json.loads(content)
-                if "handoff" in parsed:
-                    return parsed
-            except json.JSONDecodeError:
-                pass
-            
-            # Return as plain text
-            return content
+            reply.content = self._parse_single(reply.content.strip())
+            return reply
             
         except Exception as e:
             logger.error(f"Anthropic API error: {e}")
             raise
     
-    async def process_collaboration_message(self, text: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a message in collaboration mode."""
+    async def process_collaboration_message(self, text: str, context: Dict[str, Any],
+                                            on_delta: Optional[DeltaCallback] = None,
+                                            on_handoff: Optional[HandoffCallback] = None) -> ConnectorReply:
+        """Process a message in collaboration mode. on_delta receives only the envelope's message text."""
         try:
-            # Build context-aware prompt
-            goal = context.get("goal", "")
-            round_num = context.get("round", 1)
-            mode = context.get("mode", "collaborate")
-            transcript = context.get("transcript", [])
-            max_rounds = context.get("max_rounds")
-            
-            # Create user message with context
-            mode_info = f"Mode: {mode.title()}"
-            if mode == "collaborate" and max_rounds:
-                mode_info += f" (max {max_rounds} rounds)"
-            elif mode == "autopilot":
-                mode_info += " (continues until Allstop)"
-            
-            user_content = f"GOAL: {goal}\n{mode_info}\nRound: {round_num}\n\nYour task: {text}"
+            # The session prefix (goal and mode) is cached along with the system prompt; the round,
+            # task and transcript follow it uncached
+            prefix, turn = collaboration_turn(text, context)
             
-            # Add recent transcript for context
-            if transcript:
-                transcript_text = "\n".join([
-                    f"{item['sender']}: {item['message']}" 
-                    for item in transcript[-4:]  # Last 4 messages
-                ])
-                user_content += f"\n\nRecent conversation:\n{transcript_text}\n\nNow respond to: {text}"
-            
-            response = await self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=800,  # Shorter for collaboration
-                temperature=0.7,
-                system=self.collaboration_prompt,
-                messages=[
-                    {"role": "user", "content": user_content}
-                ]
+            parser = EnvelopeParser(on_delta, on_handoff)
+            reply = await self._create_message(
+                self.collaboration_prompt, turn,
+                max_tokens=self.collaboration_max_tokens,  # Shorter for collaboration
+                on_delta=parser.feed,
+                cached_prefix=prefix
             )
             
-            content = response.content[0].text.strip()
-            
-            # Parse JSON response
-            try:
-                parsed = json.loads(content)
-                
-                # Validate required fields
-                if "message" not in parsed:
-                    logger.warning("Anthropic response missing 'message' field")
-                    return {
-                        "message": content,
-                        "final": False
-                    }
-                
-                return parsed
-                
-            except json.JSONDecodeError:
-                logger.warning(f"Anthropic returned non-JSON in collaboration mode: {content}")
-                # Fallback to treating as message
-                return {
-                    "message": content,
-                    "final": False
-                }
+            reply.content = self._parse_collaboration(reply.content, parser)
+            return reply
             
         except Exception as e:
             logger.error(f"Anthropic API error in collaboration: {e}")
@@ -0,0 +1,259 @@
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Called with each chunk of streamed text as it arrives
+DeltaCallback = Callable[[str], None]
+# Called with the agent a collaboration reply hands off to, as soon as the stream names it
+HandoffCallback = Callable[[str], None]
+
+@dataclass
+class AgentSpec:
+    """One configured agent: which provider and model answer to a name, and how it is prompted."""
+    name: str
+    provider: str
+    model: str
+    display_name: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: int = 1000
+    collaboration_max_tokens: int = 800
+    strengths: str = "analysis, synthesis, explanations"
+    autopilot_focus: str = "focus on iterative improvements"
+    handoff_to: Optional[List[str]] = None  # allowed handoff targets; default: every other agent
+    next_speaker: Optional[str] = None      # who speaks when no handoff is given; default: next in the list
+    base_url: Optional[str] = None          # OpenAI-compatible servers (vLLM, Ollama, ...)
+    api_key_env: Optional[str] = None       # env var with this agent's key; default: the provider's key
+
+    def __post_init__(self):
+        if not self.display_name:
+            self.display_name = self.name
+
+DEFAULT_AGENT_SPECS = [
+    AgentSpec(
+        name="gpt", provider="openai", model="gpt-4", display_name="ChatGPT",
+        strengths="structure, editing, organization, analysis, code optimization",
+        autopilot_focus="focus on iterative improvements"
+    ),
+    AgentSpec(
+        name="claude", provider="anthropic", model="claude-sonnet-4-20250514", display_name="Claude",
+        strengths="creative writing, analysis, synthesis, explanations, brainstorming",
+        autopilot_focus="focus on building upon previous responses"
+    )
+]
+
+def default_team(name: str) -> Tuple[AgentSpec, List[AgentSpec], AgentSpec]:
+    """Spec, handoff peers and next speaker for a connector built without a registry (the gpt/claude pair)."""
+    spec = next(s for s in DEFAULT_AGENT_SPECS if s.name == name)
+    peers = [s for s in DEFAULT_AGENT_SPECS if s.name != name]
+    return spec, peers, peers[0]
+
+def single_mode_prompt(spec: AgentSpec, peers: List[AgentSpec]) -> str:
+    """System prompt for direct calls: answer in text, or hand off once with strict JSON."""
+    if not peers:
+        return f"""You are an assistant in a private room. Only speak when explicitly called.
+
+Answer in normal text only (no JSON).
+Your name is "{spec.name}"."""
+
+    count = "two" if len(peers) == 1 else str(len(peers) + 1)
+    helper = "the other assistant" if len(peers) == 1 else "another assistant"
+    targets = "" if len(peers) == 1 else "\n\"to\" must be one of: " + ", ".join(f'"{p.name}"' for p in peers) + "."
+    return f"""You are one of {count} assistants in a private room. Only speak when explicitly called.
+
+If you want {helper} to help, respond **only** with strict JSON (no extra text):
+{{ "handoff": {{ "to": "{peers[0].name}", "task": "<one sentence>" }} }}{targets}
+
+If you are answering yourself, return normal text only (no JSON).
+Never cause more than one handoff per message.
+Your name is "{spec.name}" for the handoff.to field."""
+
+def collaboration_prompt(spec: AgentSpec, peers: List[AgentSpec], next_agent: AgentSpec) -> str:
+    """System prompt for collaboration turns: a JSON envelope with message, optional handoff and final."""
+    if peers:
+        team = " and ".join(p.display_name for p in peers) if len(peers) <= 2 else \
+            ", ".join(p.display_name for p in peers[:-1]) + f" and {peers[-1].display_name}"
+        example = peers[0]
+        handoff_rule = f"Pass control to {example.display_name} with a specific task" if len(peers) == 1 else \
+            "Pass control to another agent (" + ", ".join(f'"{p.name}"' for p in peers) + ") with a specific task"
+        handoff_example = f""",
+  "handoff": {{
+    "to": "{example.name}", 
+    "task": "Brief instruction for {example.display_name}"
+  }}"""
+        handoff_line = f'\n- "handoff" (optional): {handoff_rule}'
+    else:
+        team, handoff_example, handoff_line = "the team", "", ""
+
+    return f"""You are {spec.display_name}, working collaboratively with {team} on a shared goal.
+
+COLLABORATION RULES:
+- Respond with JSON in this exact format:
+{{
+  "message": "Your response visible to everyone"{handoff_example},
+  "final": false
+}}
+
+- "message" (required): Your contribution to the conversation{handoff_line}
+- "final" (optional): Set to true if you think the goal is complete
+
+ROLE GUIDANCE:
+- You excel at: {spec.strengths}
+- Keep responses concise (2-5 sentences) to maintain collaboration flow
+- In autopilot mode, {spec.autopilot_focus}
+- If no handoff needed, omit the "handoff" field ({next_agent.display_name} will take next turn automatically)
+
+RESPOND ONLY WITH VALID JSON."""
+
+def recent_turns(transcript: Sequence[Any], count: int) -> Iterator[Any]:
+    """The last `count` turns of a session's context window, without copying it."""
+    return islice(transcript, max(len(transcript) - count, 0), None)
+
+def collaboration_turn(text: str, context: Dict[str, Any]) -> Tuple[str, str]:
+    """A collaboration turn's user message as (session prefix, this turn's part).
+
+    The prefix (goal and mode) is the same for every turn of a session, so connectors send it
+    first, right after the system prompt, where provider prompt caching can reuse it. The round
+    number, task and recent transcript change every turn and follow it.
+    """
+    goal = context.get("goal", "")
+    round_num = context.get("round", 1)
+    mode = context.get("mode", "collaborate")
+    transcript = context.get("transcript", ())
+    max_rounds = context.get("max_rounds")
+
+    mode_info = f"Mode: {mode.title()}"
+    if mode == "collaborate" and max_rounds:
+        mode_info += f" (max {max_rounds} rounds)"
+    elif mode == "autopilot":
+        mode_info += " (continues until Allstop)"
+    prefix = f"GOAL: {goal}\n{mode_info}"
+
+    current = f"Round: {round_num}\n\nYour task: {text}"
+    # Add recent transcript for context
+    if transcript:
+        transcript_text = "\n".join(
+            f"{turn.sender}: {turn.message}"
+            for turn in recent_turns(transcript, 4)  # Last 4 messages
+        )
+        current += f"\n\nRecent conversation:\n{transcript_text}\n\nNow respond to: {text}"
+    return prefix, current
+
+@dataclass
+class Usage:
+    """Token counts a provider reported for one call. input_tokens includes prompt tokens served from cache."""
+    provider: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0   # prompt tokens read from the provider's prompt cache
+    cache_write_tokens: int = 0  # prompt tokens written to it (Anthropic bills these at a premium)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+@dataclass
+class ConnectorReply:
+    """A connector's parsed reply (text or JSON envelope) together with what it cost and how long it took."""
+    content: Union[str, Dict[str, Any]]
+    usage: Optional[Usage] = None
+    ttft_ms: Optional[float] = None     # time to first token (the whole call when not streaming)
+    latency_ms: Optional[float] = None
+
+def unwrap_reply(reply: Any) -> Tuple[Any, Optional[Usage]]:
+    """Split a connector result into (content, usage); bare results carry no usage."""
+    if isinstance(reply, ConnectorReply):
+        return reply.content, reply.usage
+    return reply, None
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0,
+        "cache_read_tokens": 0, "cache_write_tokens": 0, "cost_usd": 0.0
+    }
+
+class UsageLedger:
+    """Running token totals, overall and by provider and model, with cost for models that have a price."""
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None):
+        # model -> USD per 1M tokens: {"input", "output"} and optionally {"cache_read", "cache_write"} (default: input)
+        self.prices = prices or {}
+        self.totals = _empty_totals()
+        self.by_provider: Dict[str, Dict[str, Any]] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, usage: Usage):
+        price = self.prices.get(usage.model)
+        cost = 0.0
+        if price:
+            input_price = price.get("input", 0)
+            uncached = usage.input_tokens - usage.cache_read_tokens - usage.cache_write_tokens
+            cost = (
+                uncached * input_price
+                + usage.cache_read_tokens * price.get("cache_read", input_price)
+                + usage.cache_write_tokens * price.get("cache_write", input_price)
+                + usage.output_tokens * price.get("output", 0)
+            ) / 1_000_000
+
+        for bucket in (
+            self.totals,
+            self.by_provider.setdefault(usage.provider, _empty_totals()),
+            self.by_model.setdefault(usage.model, _empty_totals())
+        ):
+            bucket["calls"] += 1
+            bucket["input_tokens"] += usage.input_tokens
+            bucket["output_tokens"] += usage.output_tokens
+            bucket["total_tokens"] += usage.total_tokens
+            bucket["cache_read_tokens"] += usage.cache_read_tokens
+            bucket["cache_write_tokens"] += usage.cache_write_tokens
+            bucket["cost_usd"] += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.totals["total_tokens"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        def rounded(bucket: Dict[str, Any]) -> Dict[str, Any]:
+            return {**bucket, "cost_usd": round(bucket["cost_usd"], 6)}
+        return {
+            **rounded(self.totals),
+            "by_provider": {name: rounded(bucket) for name, bucket in self.by_provider.items()},
+            "by_model": {name: rounded(bucket) for name, bucket in self.by_model.items()}
+        }
+
+class LatencyStats:
+    """Recent time-to-first-token and total latency per agent, reported as percentiles."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.ttft: Dict[str, Deque[float]] = {}
+        self.total: Dict[str, Deque[float]] = {}
+        self.calls: Dict[str, int] = {}
+
+    def record(self, agent: str, reply: Any):
+        if not isinstance(reply, ConnectorReply):
+            return
+        self.calls[agent] = self.calls.get(agent, 0) + 1
+        if reply.ttft_ms is not None:
+            self.ttft.setdefault(agent, deque(maxlen=self.window)).append(reply.ttft_ms)
+        if reply.latency_ms is not None:
+            self.total.setdefault(agent, deque(maxlen=self.window)).append(reply.latency_ms)
+
+    @staticmethod
+    def _percentiles(samples: Optional[Deque[float]]) -> Dict[str, Optional[float]]:
+        if not samples:
+            return {"p50": None, "p95": None, "max": None}
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+        return {"p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1], 1)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            agent: {
+                "calls": count,
+                "ttft_ms": self._percentiles(self.ttft.get(agent)),
+                "total_ms": self._percentiles(self.total.get(agent))
+            }
+            for agent, count in self.calls.items()
+        }
@@ -0,0 +1,55 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional
+from .rate_limit import RateLimiter, estimate_tokens
+from .resilience import Resilience
+from .base import AgentSpec, ConnectorReply, DeltaCallback, HandoffCallback, Usage
+
+logger = logging.getLogger(__name__)
+
+class EchoConnector:
+    """Local stand-in agent that echoes its task back. Needs no API key; handy for demos and load tests."""
+
+    def __init__(self, settings_manager, spec: AgentSpec, peers: Optional[List[AgentSpec]] = None,
+                 next_agent: Optional[AgentSpec] = None, rate_limiter: Optional[RateLimiter] = None,
+                 resilience: Optional[Resilience] = None, http_pool: Any = None):
+        self.settings_manager = settings_manager
+        self.spec = spec
+        self.name = spec.name
+        self.model = spec.model
+        self.collaboration_max_tokens = spec.collaboration_max_tokens
+        self.rate_limiter = rate_limiter or RateLimiter("echo")
+        self.resilience = resilience or Resilience("echo")  # never fails; kept for a uniform /health report
+        # Simulated provider latency, e.g. "model": "echo:0.5" waits half a second per call
+        _, _, delay = spec.model.partition(":")
+        self.delay = float(delay) if delay else 0.0
+
+    async def _reply(self, content: Any, message: str, text: str,
+                     on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
+        await self.rate_limiter.acquire(estimate_tokens(text))
+        started = time.perf_counter()
+        ttft_ms = None
+        # With a listener, the message goes out word by word, spreading the delay across the words
+        words = message.split(" ") if on_delta else [message]
+        for index, word in enumerate(words):
+            if self.delay:
+                await asyncio.sleep(self.delay / len(words))
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            if on_delta:
+                on_delta(word if index == 0 else " " + word)
+        usage = Usage("echo", self.model, estimate_tokens(text), estimate_tokens(str(content)))
+        return ConnectorReply(content, usage, ttft_ms, (time.perf_counter() - started) * 1000)
+
+    async def process_message(self, text: str, on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
+        """Process a message in single mode."""
+        message = f"[{self.spec.display_name}] {text}"
+        return await self._reply(message, message, text, on_delta)
+
+    async def process_collaboration_message(self, text: str, context: Dict[str, Any],
+                                            on_delta: Optional[DeltaCallback] = None,
+                                            on_handoff: Optional[HandoffCallback] = None) -> ConnectorReply:
+        """Process a message in collaboration mode. Echo agents never hand off."""
+        message = f"[{self.spec.display_name}, round {context.get('round', 1)}] {text}"
+        return await self._reply({"message": message, "final": False}, message, text, on_delta)
@@ -0,0 +1,211 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# JSON string escapes other than \uXXXX
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_WHITESPACE = " \t\r\n"
+_LITERAL_END = _WHITESPACE + ",:]}"
+# What a model may put before the opening brace and still be answering in JSON
+_FENCE = "```json"
+
+class _Frame:
+    """One open object or array; `key` is the object key whose value is being read."""
+
+    __slots__ = ("is_object", "key", "expect_key")
+
+    def __init__(self, is_object: bool):
+        self.is_object = is_object
+        self.key: Optional[str] = None
+        self.expect_key = is_object
+
+class EnvelopeParser:
+    """Incremental parser for the collaboration envelope {"message", "handoff", "final"}.
+
+    Feed it chunks as they stream in. The decoded "message" string goes to on_message as it
+    arrives, and "handoff.to" goes to on_handoff the moment its string closes, long before the
+    reply ends. envelope() returns the result: the strict JSON object when the reply parses,
+    otherwise whatever was read before the reply broke off (a truncated reply keeps its message
+    and handoff). A reply that does not start with JSON is streamed and returned as plain text.
+    """
+
+    def __init__(self, on_message: Optional[Callable[[str], None]] = None,
+                 on_handoff: Optional[Callable[[str], None]] = None):
+        self.on_message = on_message
+        self.on_handoff = on_handoff
+        self.chunks: List[str] = []
+        self.length = 0
+        self.mode: Optional[str] = None  # None until the first significant character, then "json" or "text"
+        self.prefix: List[str] = []
+        self.start = 0
+        self.end: Optional[int] = None   # set when the top-level object closes
+        self.stack: List[_Frame] = []
+        self.in_string = False
+        self.string_is_key = False
+        self.in_message = False  # reading the top-level "message" string
+        self.string_parts: List[str] = []
+        self.escape: Optional[str] = None
+        self.high_surrogate: Optional[str] = None
+        self.literal: List[str] = []
+        self.message_parts: List[str] = []
+        self.message_seen = False
+        self.fields: Dict[Tuple[str, ...], Any] = {}  # scalar values by key path, e.g. ("handoff", "to")
+        self.handoff_to: Optional[str] = None
+        self.recovered = False
+
+    def feed(self, chunk: str):
+        """Consume the next piece of the reply."""
+        self.chunks.append(chunk)
+        out: List[str] = []
+        for index, char in enumerate(chunk):
+            if self.mode == "json":
+                if self.end is None:
+                    self._char(char, out, self.length + index)
+            elif self.mode == "text":
+                out.append(char)
+            else:
+                self._lead(char, out, self.length + index)
+        self.length += len(chunk)
+        if out:
+            text = "".join(out)
+            self.message_parts.append(text)
+            if self.on_message:
+                self.on_message(text)
+
+    @property
+    def consumed(self) -> bool:
+        return bool(self.chunks)
+
+    @property
+    def message(self) -> str:
+        return "".join(self.message_parts)
+
+    def envelope(self) -> Dict[str, Any]:
+        """The envelope for everything fed so far."""
+        text = "".join(self.chunks)
+        if self.mode == "json" and self.end is not None:
+            try:
+                parsed = json.loads(text[self.start:self.end])
+                if isinstance(parsed, dict) and "message" in parsed:
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+
+        self.recovered = self.mode == "json"
+        envelope: Dict[str, Any] = {
+            "message": self.message.strip() if self.message_seen or self.mode == "text" else text.strip(),
+            "final": self.fields.get(("final",)) is True
+        }
+        if self.handoff_to:
+            envelope["handoff"] = {"to": self.handoff_to}
+            if ("handoff", "task") in self.fields:
+                # Left out when the reply broke off mid-task, so the caller falls back to its default
+                envelope["handoff"]["task"] = self.fields[("handoff", "task")]
+        return envelope
+
+    def _lead(self, char: str, out: List[str], position: int):
+        """Before the envelope: allow whitespace and a ```json fence, anything else means plain text."""
+        if char == "{":
+            self.mode = "json"
+            self.start = position
+            self.stack.append(_Frame(True))
+            return
+        self.prefix.append(char)
+        lead = "".join(self.prefix).strip()
+        if lead and not (_FENCE.startswith(lead) or lead == "```"):
+            self.mode = "text"
+            out.append("".join(self.prefix).lstrip())
+
+    def _path(self) -> Tuple[str, ...]:
+        return tuple(frame.key or "" for frame in self.stack)
+
+    def _char(self, char: str, out: List[str], position: int):
+        if self.in_string:
+            self._string_char(char, out)
+            return
+
+        if self.literal:
+            if char not in _LITERAL_END:
+                self.literal.append(char)
+                return
+            self._end_literal()
+
+        if char in _WHITESPACE:
+            return
+        frame = self.stack[-1]
+        if char == '"':
+            self.in_string = True
+            self.string_is_key = frame.is_object and frame.expect_key
+            self.string_parts = []
+            self.in_message = not self.string_is_key and self._path() == ("message",)
+            self.message_seen = self.message_seen or self.in_message
+        elif char == ":":
+            frame.expect_key = False
+        elif char == ",":
+            frame.expect_key = frame.is_object
+        elif char in "{[":
+            self.stack.append(_Frame(char == "{"))
+        elif char in "}]":
+            self.stack.pop()
+            if not self.stack:
+                self.end = position + 1
+        else:
+            self.literal.append(char)
+
+    def _string_char(self, char: str, out: List[str]):
+        if self.escape is not None:
+            self.escape += char
+            if self.escape[0] == "u":
+                if len(self.escape) < 5:
+                    return
+                try:
+                    decoded = chr(int(self.escape[1:], 16))
+                except ValueError:
+                    decoded = "�"
+            else:
+                decoded = _ESCAPES.get(char, char)
+            self.escape = None
+            # Characters outside the BMP arrive as two escaped surrogates; emit them once both halves are in
+            if 0xD800 <= ord(decoded) <= 0xDBFF:
+                self.high_surrogate = decoded
+                return
+            if self.high_surrogate is not None:
+                high, self.high_surrogate = ord(self.high_surrogate), None
+                if 0xDC00 <= ord(decoded) <= 0xDFFF:
+                    decoded = chr(0x10000 + ((high - 0xD800) << 10) + (ord(decoded) - 0xDC00))
+            self._emit(decoded, out)
+            return
+
+        if char == "\\":
+            self.escape = ""
+        elif char == '"':
+            self.in_string = False
+            self.in_message = False
+            value = "".join(self.string_parts)
+            if self.string_is_key:
+                self.stack[-1].key = value
+            else:
+                self._value(value)
+        else:
+            self._emit(char, out)
+
+    def _emit(self, char: str, out: List[str]):
+        if self.in_message:
+            out.append(char)
+        else:
+            self.string_parts.append(char)
+
+    def _end_literal(self):
+        raw = "".join(self.literal)
+        self.literal = []
+        try:
+            self._value(json.loads(raw))
+        except json.JSONDecodeError:
+            self._value(raw)
+
+    def _value(self, value: Any):
+        path = self._path()
+        self.fields[path] = value
+        if path == ("handoff", "to") and isinstance(value, str) and self.handoff_to is None:
+            self.handoff_to = value
+            if self.on_handoff:
+                self.on_handoff(value)
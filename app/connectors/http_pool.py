@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+import importlib
+from types import ModuleType
+from typing import Any, Dict, Optional, Type
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Where each SDK sends requests when an agent has no base_url of its own
+DEFAULT_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com"
+}
+
+def sdk_client_class(provider: str) -> Type:
+    """The async HTTP client class the provider's SDK expects (newer SDKs are built on httpx2, not httpx)."""
+    try:
+        return importlib.import_module(provider).DefaultAsyncHttpxClient
+    except (ImportError, AttributeError):
+        return httpx.AsyncClient
+
+def _httpx_package(client_class: Type) -> ModuleType:
+    """The httpx-style package (httpx or httpx2) that client_class is built on, for matching limits and transports."""
+    for base in client_class.__mro__:
+        if base.__name__ == "AsyncClient":
+            return importlib.import_module(base.__module__.split(".")[0])
+    return httpx
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class ProviderPool:
+    """One sized keep-alive connection pool to a provider endpoint, shared by every agent that calls it."""
+
+    def __init__(self, base_url: str, max_connections: int = 20, max_keepalive: int = 10,
+                 keepalive_expiry: float = 120.0, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 http2: bool = False, client_class: Type = httpx.AsyncClient):
+        self.base_url = base_url
+        http = _httpx_package(client_class)
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logger.warning("HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+        self.limits = http.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = http.Timeout(read_timeout, connect=connect_timeout)
+        self.transport = http.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+        self.client = client_class(
+            transport=self.transport,
+            timeout=self.timeout,
+            event_hooks={"request": [self._count_request]}
+        )
+        self.requests = 0
+        self.warmed_connections = 0
+        self.warm_up_ms: Optional[float] = None
+
+    async def _count_request(self, request: Any):
+        self.requests += 1
+
+    async def warm_up(self, connections: int = 1):
+        """Open connections (DNS, TCP, TLS) before the first real request. Any HTTP response will do."""
+        started = time.perf_counter()
+        quick = type(self.timeout)(self.timeout.connect or 5.0)
+        results = await asyncio.gather(
+            *(self.client.head(self.base_url, timeout=quick) for _ in range(connections)),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        self.warmed_connections = len(results) - len(failures)
+        self.warm_up_ms = round((time.perf_counter() - started) * 1000, 1)
+        if failures:
+            logger.warning(f"Warm-up of {self.base_url} failed for {len(failures)} connection(s): {failures[0]!r}")
+        else:
+            logger.info(f"Warmed {self.warmed_connections} connection(s) to {self.base_url} in {self.warm_up_ms}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        # httpcore's pool is not public API; report what it exposes and degrade to nothing if that changes
+        connections = list(getattr(getattr(self.transport, "_pool", None), "connections", []))
+        active = sum(1 for c in connections if not c.is_idle())
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "open_connections": len(connections),
+            "active_connections": active,
+            "utilization": round(active / self.limits.max_connections, 3) if self.limits.max_connections else 0.0,
+            "requests": self.requests,
+            "warmed_connections": self.warmed_connections,
+            "warm_up_ms": self.warm_up_ms
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+class HttpPools:
+    """Connection pools by endpoint: agents on the same provider (or the same OpenAI-compatible server) share one."""
+
+    def __init__(self, settings_manager):
+        self.settings_manager = settings_manager
+        self.enabled = settings_manager.get("http_pooling", True)
+        self.pools: Dict[str, ProviderPool] = {}
+        self.warm_up_task: Optional[asyncio.Task] = None
+
+    def pool_for(self, provider: str, base_url: Optional[str] = None) -> Optional[ProviderPool]:
+        """The pool for an agent's endpoint, or None to leave the SDK's own client in place (e.g. echo agents)."""
+        url = base_url or DEFAULT_BASE_URLS.get(provider)
+        if not self.enabled or not url:
+            return None
+        if url not in self.pools:
+            get = self.settings_manager.get
+            self.pools[url] = ProviderPool(
+                url,
+                max_connections=get("http_max_connections", 20),
+                max_keepalive=get("http_max_keepalive", 10),
+                keepalive_expiry=get("http_keepalive_expiry", 120.0),
+                connect_timeout=get("http_connect_timeout", 5.0),
+                read_timeout=get("http_read_timeout", 60.0),
+                http2=get("http2", False),
+                client_class=sdk_client_class(provider)
+            )
+        return self.pools[url]
+
+    def start_warm_up(self):
+        """Warm up in the background so startup (and the first requests) do not wait on slow endpoints."""
+        if self.warm_up_task is None:
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        """Pre-open connections to every endpoint in use."""
+        connections = self.settings_manager.get("http_warmup_connections", 2)
+        if connections <= 0 or not self.pools:
+            return
+        await asyncio.gather(*(pool.warm_up(connections) for pool in self.pools.values()))
+
+    async def close(self):
+        if self.warm_up_task:
+            self.warm_up_task.cancel()
+            await asyncio.gather(self.warm_up_task, return_exceptions=True)
+            self.warm_up_task = None
+        await asyncio.gather(*(pool.close() for pool in self.pools.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {url: pool.stats() for url, pool in self.pools.items()}
@@ -1,148 +1,210 @@
+import os
 import json
 import logging
+import time
 import asyncio
-from typing import Dict, Any, Union
+from typing import Dict, Any, List, Optional, Union
 import openai
+from .rate_limit import RateLimiter, estimate_tokens
+from .envelope import EnvelopeParser
+from .resilience import Resilience, resilience_from_settings
+from .http_pool import ProviderPool
+from .base import AgentSpec, ConnectorReply, DeltaCallback, HandoffCallback, Usage, default_team, collaboration_prompt, collaboration_turn, single_mode_prompt
 
 logger = logging.getLogger(__name__)
 
 class OpenAIConnector:
-    """Connector for OpenAI's ChatGPT API with collaboration support."""
+    """Connector for OpenAI chat models (or any OpenAI-compatible server) with collaboration support."""
     
-    def __init__(self, settings_manager):
+    def __init__(self, settings_manager, spec: Optional[AgentSpec] = None, peers: Optional[List[AgentSpec]] = None,
+                 next_agent: Optional[AgentSpec] = None, rate_limiter: Optional[RateLimiter] = None,
+                 resilience: Optional[Resilience] = None, http_pool: Optional[ProviderPool] = None):
         self.settings_manager = settings_manager
-        self.client = openai.AsyncOpenAI(
-            api_key=settings_manager.get_openai_key()
+        if spec is None:
+            spec, peers, next_agent = default_team("gpt")
+        self.spec = spec
+        self.name = spec.name
+        self.model = spec.model
+        self.collaboration_max_tokens = spec.collaboration_max_tokens
+        self.stream = settings_manager.get("stream_responses", True)
+        
+        api_key = os.getenv(spec.api_key_env) if spec.api_key_env else settings_manager.get_openai_key()
+        # A shared, pre-warmed connection pool when the registry provides one; otherwise the SDK's own client
+        pooled = {"http_client": http_pool.client, "timeout": http_pool.timeout} if http_pool else {}
+        client_args = {
+            "api_key": api_key,
+            "base_url": spec.base_url,
+            "max_retries": 0  # retries are ours (self.resilience), paced by the shared rate limiter
+        }
+        try:
+            self.client = openai.AsyncOpenAI(**client_args, **pooled)
+        except TypeError as e:
+            if not pooled:
+                raise
+            logger.warning(f"openai SDK refused the shared connection pool ({e}); using its own client")
+            self.client = openai.AsyncOpenAI(**client_args)
+        self.rate_limiter = rate_limiter or RateLimiter(
+            "openai", settings_manager.get("openai_rpm", 0), settings_manager.get("openai_tpm", 0)
         )
+        self.resilience = resilience or resilience_from_settings("openai", settings_manager)
         
-        # Basic system prompt for single mode
-        self.base_system_prompt = """You are one of two assistants in a private room. Only speak when explicitly called.
-
-If you want the other assistant to help, respond **only** with strict JSON (no extra text):
-{ "handoff": { "to": "claude", "task": "<one sentence>" } }
-
-If you are answering yourself, return normal text only (no JSON).
-Never cause more than one handoff per message.
-Your name is "gpt" for the handoff.to field."""
-
-        # Collaboration system prompt
-        self.collaboration_prompt = """You are ChatGPT, working collaboratively with Claude on a shared goal. 
-
-COLLABORATION RULES:
-- Respond with JSON in this exact format:
-{
-  "message": "Your response visible to everyone",
-  "handoff": {
-    "to": "claude", 
-    "task": "Brief instruction for Claude"
-  },
-  "final": false
-}
-
-- "message" (required): Your contribution to the conversation
-- "handoff" (optional): Pass control to Claude with a specific task
-- "final" (optional): Set to true if you think the goal is complete
+        # Prompts name this agent's handoff targets and the agent that speaks after it
+        self.base_system_prompt = single_mode_prompt(spec, peers or [])
+        self.collaboration_prompt = collaboration_prompt(spec, peers or [], next_agent or spec)
+    
+    async def _create_completion(self, messages: List[Dict[str, str]], max_tokens: int,
+                                 on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
+        """One chat completions call through the provider's retry/backoff/circuit-breaker layer.
 
-ROLE GUIDANCE:
-- You excel at: structure, editing, organization, analysis, code optimization
-- Keep responses concise (2-5 sentences) to maintain collaboration flow
-- In autopilot mode, focus on iterative improvements
-- If no handoff needed, omit the "handoff" field (Claude will take next turn automatically)
+        Failed attempts are retried only until streamed text has been handed on, so nothing is shown twice.
+        """
+        streamed = False
+        
+        def forward(chunk: str):
+            nonlocal streamed
+            streamed = True
+            on_delta(chunk)
+        
+        return await self.resilience.call(
+            lambda reserved: self._request_completion(messages, max_tokens, reserved, forward if on_delta else None),
+            can_retry=lambda: not streamed,
+            admit=lambda: self.rate_limiter.acquire(estimate_tokens(*(m["content"] for m in messages)) + max_tokens)
+        )
+    
+    async def _request_completion(self, messages: List[Dict[str, str]], max_tokens: int, reserved: int,
+                                  on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
+        """Call the chat completions API once, with `reserved` tokens of RPM/TPM budget already taken; returns the raw text.
 
-RESPOND ONLY WITH VALID JSON."""
+        When streaming, each text chunk goes to on_delta as it arrives and usage comes from the final chunk.
+        """
+        request: Dict[str, Any] = {}
+        if self.stream:
+            request = {"stream": True, "stream_options": {"include_usage": True}}
+        started = time.perf_counter()
+        ttft_ms = None
+        parts: List[str] = []
+        accepted = False
+        try:
+            try:
+                raw = await self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=self.spec.temperature,
+                    **request
+                )
+            except openai.RateLimitError as e:
+                self.rate_limiter.on_rate_limited(e.response.headers)
+                raise
+            accepted = True
+            
+            if self.stream:
+                usage = None
+                stream = raw.parse()
+                try:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            usage = self._usage_from(chunk.model, chunk.usage)
+                        piece = chunk.choices[0].delta.content if chunk.choices else None
+                        if piece:
+                            if ttft_ms is None:
+                                ttft_ms = (time.perf_counter() - started) * 1000
+                            parts.append(piece)
+                            if on_delta:
+                                on_delta(piece)
+                finally:
+                    await stream.close()
+                content = "".join(parts)
+            else:
+                response = raw.parse()
+                usage = self._usage(response)
+                content = response.choices[0].message.content or ""
+        except BaseException:
+            # No usage will be reported (failed, rejected, cancelled by stop/allstop or the deadline):
+            # a rejected request used nothing, one broken off mid-reply the prompt and the text received
+            self.rate_limiter.settle(reserved, reserved - max_tokens + estimate_tokens(*parts) if accepted else 0)
+            raise
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        # A server that reports no usage is charged an estimate: the prompt plus the text it generated
+        self.rate_limiter.settle(reserved, usage.total_tokens if usage else reserved - max_tokens + estimate_tokens(content))
+        self.rate_limiter.update_from_headers(raw.headers)
+        return ConnectorReply(content, usage, ttft_ms if ttft_ms is not None else latency_ms, latency_ms)
+    
+    def _usage(self, response: Any) -> Optional[Usage]:
+        """Token counts from the API response, if it reported any."""
+        return self._usage_from(response.model, response.usage) if response.usage else None
     
-    async def process_message(self, text: str) -> Union[str, Dict[str, Any]]:
+    def _usage_from(self, model: Optional[str], usage: Any) -> Usage:
+        # prompt_tokens already includes the cached part; prompt caching is automatic, so there are no writes
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Usage(
+            "openai", model or self.model, usage.prompt_tokens or 0, usage.completion_tokens or 0,
+            cache_read_tokens=getattr(details, "cached_tokens", None) or 0
+        )
+    
+    def _parse_single(self, content: str) -> Union[str, Dict[str, Any]]:
+        """Single mode: a handoff JSON object, or plain text."""
+        # Try to parse as JSON (for handoffs)
+        try:
+            parsed = json.loads(content)
+            if "handoff" in parsed:
+                return parsed
+        except json.JSONDecodeError:
+            pass
+        
+        # Return as plain text
+        return content
+    
+    def _parse_collaboration(self, content: str, parser: Optional[EnvelopeParser] = None) -> Dict[str, Any]:
+        """Collaboration mode: the JSON envelope, what could be recovered of a broken one, or the raw text as its message."""
+        if parser is None or not parser.consumed:
+            # Not streamed: parse the whole reply at once
+            parser = EnvelopeParser()
+            parser.feed(content)
+        envelope = parser.envelope()
+        if parser.mode == "text":
+            logger.warning(f"OpenAI returned non-JSON in collaboration mode: {content}")
+        elif parser.recovered:
+            logger.warning(f"OpenAI returned an incomplete envelope in collaboration mode; recovered: {envelope}")
+        return envelope
+    
+    async def process_message(self, text: str, on_delta: Optional[DeltaCallback] = None) -> ConnectorReply:
         """Process a message in single mode."""
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self.base_system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            
-            content = response.choices[0].message.content.strip()
+            reply = await self._create_completion([
+                {"role": "system", "content": self.base_system_prompt},
+                {"role": "user", "content": text}
+            ], max_tokens=self.spec.max_tokens, on_delta=on_delta)
             
-            # Try to parse as JSON (for handoffs)
-            try:
-                parsed = json.loads(content)
-                if "handoff" in parsed:
-                    return parsed
-            except json.JSONDecodeError:
-                pass
-            
-            # Return as plain text
-            return content
+            reply.content = self._parse_single(reply.content.strip())
+            return reply
             
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
             raise
     
-    async def process_collaboration_message(self, text: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a message in collaboration mode."""
+    async def process_collaboration_message(self, text: str, context: Dict[str, Any],
+                                            on_delta: Optional[DeltaCallback] = None,
+                                            on_handoff: Optional[HandoffCallback] = None) -> ConnectorReply:
+        """Process a message in collaboration mode. on_delta receives only the envelope's message text."""
         try:
-            # Build context-aware prompt
-            goal = context.get("goal", "")
-            round_num = context.get("round", 1)
-            mode = context.get("mode", "collaborate")
-            transcript = context.get("transcript", [])
-            max_rounds = context.get("max_rounds")
-            
-            # Create conversation context
-            conversation = [{"role": "system", "content": self.collaboration_prompt}]
-            
-            # Add goal and mode info
-            mode_info = f"Mode: {mode.title()}"
-            if mode == "collaborate" and max_rounds:
-                mode_info += f" (max {max_rounds} rounds)"
-            elif mode == "autopilot":
-                mode_info += " (continues until Allstop)"
-                
-            user_content = f"GOAL: {goal}\n{mode_info}\nRound: {round_num}\n\nYour task: {text}"
-            
-            # Add recent transcript for context
-            if transcript:
-                transcript_text = "\n".join([
-                    f"{item['sender']}: {item['message']}" 
-                    for item in transcript[-4:]  # Last 4 messages
-                ])
-                user_content += f"\n\nRecent conversation:\n{transcript_text}\n\nNow respond to: {text}"
+            # Stable prefix first (system prompt, then the session's goal and mode) so OpenAI's automatic
+            # prompt caching can reuse it from turn to turn; the round, task and transcript come last
+            prefix, turn = collaboration_turn(text, context)
+            conversation = [
+                {"role": "system", "content": self.collaboration_prompt},
+                {"role": "user", "content": f"{prefix}\n{turn}"}
+            ]
             
-            conversation.append({"role": "user", "content": user_content})
-            
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=conversation,
-                max_tokens=800,  # Shorter for collaboration
-                temperature=0.7
+            parser = EnvelopeParser(on_delta, on_handoff)
+            reply = await self._create_completion(
+                conversation, max_tokens=self.collaboration_max_tokens,  # Shorter for collaboration
+                on_delta=parser.feed
             )
             
-            content = response.choices[0].message.content.strip()
-            
-            # Parse JSON response
-            try:
-                parsed = json.loads(content)
-                
-                # Validate required fields
-                if "message" not in parsed:
-                    logger.warning("OpenAI response missing 'message' field")
-                    return {
-                        "message": content,
-                        "final": False
-                    }
-                
-                return parsed
-                
-            except json.JSONDecodeError:
-                logger.warning(f"OpenAI returned non-JSON in collaboration mode: {content}")
-                # Fallback to treating as message
-                return {
-                    "message": content,
-                    "final": False
-                }
+            reply.content = self._parse_collaboration(reply.content, parser)
+            return reply
             
         except Exception as e:
             logger.error(f"OpenAI API error in collaboration: {e}")
@@ -0,0 +1,176 @@
+import re
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough prompt size (~4 characters per token) used to reserve TPM budget before a call."""
+    return sum(len(text) for text in texts if text) // 4 + 1
+
+class TokenBucket:
+    """Per-minute budget that refills continuously. A capacity of 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.configured = per_minute
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def delay(self, amount: int, now: float) -> float:
+        """Seconds until `amount` can be taken (requests larger than the bucket only wait for a full one)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return needed * 60.0 / self.capacity if needed > 0 else 0.0
+
+    def take(self, amount: int):
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: int):
+        if self.capacity > 0 and amount > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+    def observe(self, limit: Optional[int], remaining: Optional[int]):
+        """Adopt the provider's view: learn the limit when none is configured, never exceed what it says is left."""
+        if limit and self.configured <= 0 and limit != self.capacity:
+            self.capacity = limit
+            self.level = float(limit)
+        if remaining is not None and self.capacity > 0:
+            self._refill(time.monotonic())
+            self.level = min(self.level, float(remaining))
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self.capacity <= 0:
+            return {"limit_per_minute": 0, "available": None, "utilization": 0.0}
+        self._refill(time.monotonic())
+        return {
+            "limit_per_minute": self.capacity,
+            "available": int(max(self.level, 0)),
+            "utilization": round(1 - max(self.level, 0) / self.capacity, 3)
+        }
+
+class RateLimiter:
+    """Client-side RPM/TPM budget for one provider. Callers queue in FIFO order until both buckets allow the call."""
+
+    def __init__(self, provider: str, rpm: int = 0, tpm: int = 0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0  # set from retry-after on a 429
+        self._lock = asyncio.Lock()
+
+        # Metrics
+        self.granted = 0
+        self.waited = 0
+        self.total_wait_ms = 0.0
+        self.rate_limited = 0
+
+    async def acquire(self, tokens: int) -> int:
+        """Wait for budget for one request of about `tokens` tokens; returns the amount reserved."""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.delay(1, now),
+                    self.tokens.delay(tokens, now)
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+        self.granted += 1
+        wait_ms = (time.monotonic() - started) * 1000
+        if wait_ms >= 1:
+            self.waited += 1
+            self.total_wait_ms += wait_ms
+        return tokens
+
+    def settle(self, reserved: int, used: int):
+        """Correct the TPM reservation once the real (or, failing that, estimated) usage is known."""
+        if used < reserved:
+            self.tokens.refund(reserved - used)
+        else:
+            self.tokens.take(used - reserved)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Sync the buckets with the provider's rate-limit response headers."""
+        info = parse_rate_limit_headers(headers)
+        self.requests.observe(info["limit_requests"], info["remaining_requests"])
+        self.tokens.observe(info["limit_tokens"], info["remaining_tokens"])
+
+    def on_rate_limited(self, headers: Optional[Mapping[str, str]]):
+        """A 429 got through: pause every queued caller until the provider says to retry."""
+        self.rate_limited += 1
+        retry_after = 1.0
+        if headers:
+            self.update_from_headers(headers)
+            retry_after = _parse_retry_after(headers) or retry_after
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"{self.provider} rate limited; pausing requests for {retry_after:.1f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.snapshot(),
+            "tokens": self.tokens.snapshot(),
+            "granted": self.granted,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.total_wait_ms / self.waited, 1) if self.waited else 0.0,
+            "rate_limited": self.rate_limited,
+            "blocked_for_s": round(max(self.blocked_until - time.monotonic(), 0), 2)
+        }
+
+def _int_header(headers: Mapping[str, str], *names: str) -> Optional[int]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+            except ValueError:
+                return None
+    return None
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def _parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """retry-after (seconds or HTTP date), falling back to OpenAI's duration-style reset headers."""
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+    reset = headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset-tokens")
+    if reset:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(amount) * units[unit] for amount, unit in _DURATION.findall(reset)) or None
+    reset = headers.get("anthropic-ratelimit-requests-reset") or headers.get("anthropic-ratelimit-tokens-reset")
+    if reset:
+        try:
+            return max((datetime.fromisoformat(reset.replace("Z", "+00:00")).timestamp() - time.time()), 0.0)
+        except ValueError:
+            return None
+    return None
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Dict[str, Optional[int]]:
+    """Read OpenAI (x-ratelimit-*) or Anthropic (anthropic-ratelimit-*) limit/remaining headers."""
+    return {
+        "limit_requests": _int_header(headers, "x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+        "remaining_requests": _int_header(headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"),
+        "limit_tokens": _int_header(headers, "x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"),
+        "remaining_tokens": _int_header(headers, "x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining")
+    }
@@ -0,0 +1,135 @@
+import json
+import logging
+import importlib
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from .base import AgentSpec, DEFAULT_AGENT_SPECS
+from .rate_limit import RateLimiter
+from .resilience import Resilience, resilience_from_settings
+from .http_pool import DEFAULT_BASE_URLS, HttpPools
+
+logger = logging.getLogger(__name__)
+
+# provider -> (module, class); imported on first use so an unused provider's SDK need not be installed
+PROVIDERS: Dict[str, Tuple[str, str]] = {
+    "openai": ("openai_conn", "OpenAIConnector"),
+    "anthropic": ("anthropic_conn", "AnthropicConnector"),
+    "echo": ("echo_conn", "EchoConnector")
+}
+
+def register_provider(name: str, module: str, class_name: str):
+    """Make a connector class available to AGENTS_CONFIG under a provider name."""
+    PROVIDERS[name] = (module, class_name)
+
+def load_agent_specs(settings_manager) -> List[AgentSpec]:
+    """Agents from AGENTS_CONFIG (a JSON list, or a path to a JSON file), else the default gpt/claude pair."""
+    raw = (settings_manager.get("agents_config") or "").strip()
+    if not raw:
+        return list(DEFAULT_AGENT_SPECS)
+
+    if not raw.startswith("["):
+        with open(raw, "r") as f:
+            raw = f.read()
+
+    entries = json.loads(raw)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("AGENTS_CONFIG must be a non-empty JSON list of agents")
+
+    specs = []
+    for entry in entries:
+        try:
+            specs.append(AgentSpec(**entry))
+        except TypeError as e:
+            raise ValueError(f"Invalid agent in AGENTS_CONFIG ({entry.get('name', '?')}): {e}")
+
+    names = [spec.name for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate agent names in AGENTS_CONFIG: {names}")
+    if "panel" in names or "router" in names:
+        raise ValueError("'panel' and 'router' are reserved and cannot be agent names")
+    return specs
+
+class RoutingTable:
+    """Handoff graph between agents. Validation and next-speaker lookups are single dict/set hits."""
+
+    def __init__(self, specs: List[AgentSpec]):
+        self.order = [spec.name for spec in specs]
+        self.first = self.order[0]
+        self.edges: Dict[str, FrozenSet[str]] = {}
+        self.rotation: Dict[str, str] = {}
+
+        known = set(self.order)
+        for index, spec in enumerate(specs):
+            targets = spec.handoff_to if spec.handoff_to is not None else [n for n in self.order if n != spec.name]
+            unknown = set(targets) - known
+            if unknown:
+                raise ValueError(f"Agent {spec.name} hands off to unknown agent(s): {sorted(unknown)}")
+            self.edges[spec.name] = frozenset(targets)
+
+            next_speaker = spec.next_speaker or self.order[(index + 1) % len(self.order)]
+            if next_speaker not in known:
+                raise ValueError(f"Agent {spec.name} has unknown next_speaker: {next_speaker}")
+            self.rotation[spec.name] = next_speaker
+
+    def can_hand_off(self, sender: str, target: Any) -> bool:
+        return target in self.edges.get(sender, ())
+
+    def next_speaker(self, sender: str) -> str:
+        """Who takes the next turn when the sender names nobody."""
+        return self.rotation.get(sender, self.first)
+
+    def handoff_targets(self, name: str) -> List[str]:
+        """Allowed targets in configuration order (for prompts and the UI)."""
+        return [n for n in self.order if n in self.edges.get(name, ())]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            name: {"handoff_to": self.handoff_targets(name), "next_speaker": self.rotation[name]}
+            for name in self.order
+        }
+
+def endpoint_key(spec: AgentSpec) -> str:
+    """Which budget and breaker an agent shares: its provider's own API, or the server at its base_url."""
+    default = DEFAULT_BASE_URLS.get(spec.provider)
+    if not spec.base_url or spec.base_url.rstrip("/") == (default or "").rstrip("/"):
+        return spec.provider
+    return f"{spec.provider}@{spec.base_url}"
+
+def build_connectors(specs: List[AgentSpec], routing: RoutingTable, settings_manager,
+                     http_pools: Optional[HttpPools] = None
+                     ) -> Tuple[Dict[str, Any], Dict[str, RateLimiter], Dict[str, Resilience]]:
+    """Instantiate one connector per agent. Agents on the same endpoint share its RPM/TPM budget, circuit breaker
+    and connection pool; an OpenAI-compatible server at a custom base_url is not OpenAI."""
+    by_name = {spec.name: spec for spec in specs}
+    limiters: Dict[str, RateLimiter] = {}
+    resilience: Dict[str, Resilience] = {}
+    connectors: Dict[str, Any] = {}
+
+    for spec in specs:
+        if spec.provider not in PROVIDERS:
+            raise ValueError(f"Agent {spec.name} uses unknown provider: {spec.provider}. Known: {sorted(PROVIDERS)}")
+        module_name, class_name = PROVIDERS[spec.provider]
+        connector_class = getattr(importlib.import_module(f".{module_name}", __package__), class_name)
+
+        endpoint = endpoint_key(spec)
+        if endpoint not in limiters:
+            # *_RPM / *_TPM describe the provider's own API; other endpoints learn their limits from headers
+            own_api = endpoint == spec.provider
+            limiters[endpoint] = RateLimiter(
+                endpoint,
+                settings_manager.get(f"{spec.provider}_rpm", 0) if own_api else 0,
+                settings_manager.get(f"{spec.provider}_tpm", 0) if own_api else 0
+            )
+            resilience[endpoint] = resilience_from_settings(endpoint, settings_manager)
+
+        connectors[spec.name] = connector_class(
+            settings_manager,
+            spec=spec,
+            peers=[by_name[n] for n in routing.handoff_targets(spec.name)],
+            next_agent=by_name[routing.next_speaker(spec.name)],
+            rate_limiter=limiters[endpoint],
+            resilience=resilience[endpoint],
+            http_pool=http_pools.pool_for(spec.provider, spec.base_url) if http_pools else None
+        )
+        logger.info(f"Agent {spec.name}: {spec.provider}/{spec.model}")
+
+    return connectors, limiters, resilience
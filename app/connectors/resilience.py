@@ -0,0 +1,177 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Worth another attempt: rate limited, overloaded (Anthropic's 529) or a server-side failure
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, dropped connections and retryable HTTP statuses, for either SDK."""
+    if isinstance(error, TimeoutError):
+        return True
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    # APIConnectionError (and its APITimeoutError) carry no status in both SDKs
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+def is_outage(error: BaseException) -> bool:
+    """Failures that say the provider itself is unwell. A 429 means busy, not down, and is left to the rate limiter."""
+    return is_retryable(error) and getattr(error, "status_code", None) != 429
+
+class CircuitBreaker:
+    """Per-provider breaker: opens after `threshold` consecutive outages, then lets one probe call through per cooldown."""
+
+    def __init__(self, provider: str, threshold: int = 5, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"  # closed -> open -> half_open -> closed (or back to open)
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        if self.threshold <= 0 or self.state == "closed":
+            return
+        if self.state == "open" and self.clock() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        retry_in = max(self.cooldown - (self.clock() - self.opened_at), 0.0)
+        raise CircuitOpenError(f"{self.provider} is failing; not calling it for another {retry_in:.1f}s")
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"{self.provider} circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.threshold > 0 and self.failures >= self.threshold):
+            self.state = "open"
+            self.opened_at = self.clock()
+            self.opened += 1
+            logger.warning(f"{self.provider} circuit opened after {self.failures} consecutive failures")
+
+    def abandon_probe(self):
+        """A probe call was cancelled before it could tell us anything."""
+        self.probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "rejected_calls": self.rejected,
+            "retry_in_s": round(max(self.cooldown - (self.clock() - self.opened_at), 0.0), 1) if self.state == "open" else 0.0
+        }
+
+class Resilience:
+    """Retries with jittered exponential backoff under a per-call deadline, behind a provider's circuit breaker.
+
+    One instance per provider, shared by its connectors like the RateLimiter. Each attempt must be
+    safe to repeat: the connectors only allow a retry until the first streamed text has gone out.
+    """
+
+    def __init__(self, provider: str, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = 90.0, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker(provider)
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: anywhere between 0 and the capped exponential delay for this attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(self, attempt: Callable[..., Awaitable[T]], can_retry: Callable[[], bool] = lambda: True,
+                   admit: Optional[Callable[[], Awaitable[Any]]] = None) -> T:
+        """Run attempt() until it succeeds, fails for good, or the deadline passes.
+
+        admit (e.g. the rate limiter's queue) runs before each attempt and its result is passed to
+        attempt(). Time spent there is ours, not the provider's: it does not count against the
+        deadline, and so can never time out as a provider failure.
+        """
+        deadline = time.monotonic() + self.deadline
+        number = 0
+        while True:
+            number += 1
+            self.breaker.before_call()
+            try:
+                if admit is None:
+                    call = attempt()
+                else:
+                    queued = time.monotonic()
+                    admitted = await admit()
+                    deadline += time.monotonic() - queued
+                    call = attempt(admitted)
+                result = await asyncio.wait_for(call, timeout=max(deadline - time.monotonic(), 0.001))
+            except asyncio.CancelledError:
+                self.breaker.abandon_probe()
+                raise
+            except Exception as e:
+                error = e
+                if isinstance(error, asyncio.TimeoutError):
+                    self.deadline_exceeded += 1
+                    error = TimeoutError(f"{self.provider} call exceeded its {self.deadline:.0f}s deadline")
+                if is_outage(error):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()  # the provider answered, even if with an error
+
+                delay = self.backoff(number)
+                if (not is_retryable(error) or number >= self.max_attempts or not can_retry()
+                        or time.monotonic() + delay >= deadline):
+                    raise error
+                self.retries += 1
+                logger.warning(f"{self.provider} call failed ({type(error).__name__}: {error}); "
+                               f"retry {number}/{self.max_attempts - 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.breaker.snapshot(),
+            "retries": self.retries,
+            "deadline_exceeded": self.deadline_exceeded
+        }
+
+def resilience_from_settings(provider: str, settings_manager) -> Resilience:
+    """Resilience for a provider, configured from RETRY_* / CALL_DEADLINE / BREAKER_* settings."""
+    return Resilience(
+        provider,
+        max_attempts=settings_manager.get("retry_max_attempts", 3),
+        base_delay=settings_manager.get("retry_base_delay", 0.5),
+        max_delay=settings_manager.get("retry_max_delay", 8.0),
+        deadline=settings_manager.get("call_deadline", 90.0),
+        breaker=CircuitBreaker(
+            provider,
+            threshold=settings_manager.get("breaker_failure_threshold", 5),
+            cooldown=settings_manager.get("breaker_cooldown", 30.0)
+        )
+    )
@@ -0,0 +1,139 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Single-mode replies keyed on provider, model, system prompt, temperature and text.
+
+    An in-memory LRU with a TTL, optionally backed by a SQLite file that survives restarts (entries
+    read from disk are promoted to memory). Only deterministic calls are cached: an agent with a
+    temperature above 0 bypasses the cache unless `force` is set.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, path: Optional[str] = None,
+                 force: bool = False, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.force = force
+        self.clock = clock
+        self.memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, content)
+        self.path = path
+        self.db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            with self.db:
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (self.clock(),))
+
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(provider: str, model: str, system: str, temperature: float, text: str) -> str:
+        raw = json.dumps([provider, model, system, temperature, text], ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def cacheable(self, temperature: float) -> bool:
+        """Whether a call at this temperature may be served from (and stored in) the cache."""
+        if self.force or temperature <= 0:
+            return True
+        self.bypassed += 1
+        return False
+
+    async def get(self, key: str) -> Optional[Any]:
+        """The cached reply content, or None."""
+        now = self.clock()
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry[1]
+            del self.memory[key]
+            self.expired += 1
+
+        if self.db is not None:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                expires_at, content = row
+                self._remember(key, expires_at, content)
+                self.hits["disk"] += 1
+                return content
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, content: Any):
+        expires_at = self.clock() + self.ttl
+        self._remember(key, expires_at, content)
+        self.stores += 1
+        if self.db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, json.dumps(content), expires_at)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error(f"Could not write response cache entry to {self.path}: {e}")
+
+    def _remember(self, key: str, expires_at: float, content: Any):
+        self.memory[key] = (expires_at, content)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        with self._db_lock:
+            row = self.db.execute("SELECT expires_at, content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                with self.db:
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expired += 1
+                return None
+            return row[0], json.loads(row[1])
+
+    def _disk_put(self, key: str, content: str, expires_at: float):
+        with self._db_lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, content, expires_at) VALUES (?, ?, ?)",
+                (key, content, expires_at)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits["memory"] + self.hits["disk"]
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk": self.path,
+            "force": self.force,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expired": self.expired
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
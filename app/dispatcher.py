@@ -0,0 +1,122 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class EventDispatcher:
+    """Runs long router work as tracked background tasks so the receive loop stays responsive."""
+
+    def __init__(self):
+        self.tasks: Set[asyncio.Task] = set()
+        self.tasks_by_key: Dict[str, Set[asyncio.Task]] = {}
+
+    def submit(self, coro: Coroutine[Any, Any, Any], key: Optional[str] = None) -> asyncio.Task:
+        """Schedule a coroutine as a background task, optionally grouped under a key (e.g. session_id)."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        if key:
+            self.tasks_by_key.setdefault(key, set()).add(task)
+        task.add_done_callback(lambda t: self._on_done(t, key))
+        return task
+
+    def _on_done(self, task: asyncio.Task, key: Optional[str]):
+        """Forget a finished task and log anything it raised."""
+        self.tasks.discard(task)
+        if key and key in self.tasks_by_key:
+            self.tasks_by_key[key].discard(task)
+            if not self.tasks_by_key[key]:
+                del self.tasks_by_key[key]
+
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc:
+            logger.error(f"Background task failed: {exc}")
+
+    def pending(self, key: Optional[str] = None) -> int:
+        """Number of running tasks, overall or for one key."""
+        if key is None:
+            return len(self.tasks)
+        return len(self.tasks_by_key.get(key, ()))
+
+    async def shutdown(self):
+        """Cancel all running tasks and wait for them to unwind."""
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"Dispatcher shut down ({len(tasks)} task(s) cancelled)")
+
+class SessionOutbox:
+    """Publishes one session's events in order from a background task so agent turns never wait on fan-out."""
+
+    def __init__(self, broadcast_fn: Callable, name: str = ""):
+        self.broadcast_fn = broadcast_fn
+        self.name = name
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.published = 0
+
+    def post(self, event: Dict[str, Any]):
+        """Queue an event for broadcast without waiting for it."""
+        self.queue.append(event)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._publish())
+
+    async def _publish(self):
+        while self.queue:
+            event = self.queue.popleft()
+            try:
+                await self.broadcast_fn(event)
+                self.published += 1
+            except Exception as e:
+                logger.error(f"Outbox {self.name} failed to broadcast {event.get('type')}: {e}")
+
+    async def flush(self):
+        """Wait until everything posted so far has been broadcast (used before a session's end event)."""
+        if self.task and not self.task.done():
+            # Shielded: a cancelled caller must not cut the publisher off mid-queue
+            await asyncio.shield(self.task)
+
+    @property
+    def pending(self) -> int:
+        return len(self.queue)
+
+class DeltaStream:
+    """Batches streamed text chunks into agent_delta events, posting at most one per interval.
+
+    Each event carries the character offset of its text in the full reply, so a client that
+    missed a chunk can tell and wait for the final agent_response instead.
+    """
+
+    def __init__(self, outbox: SessionOutbox, template: Dict[str, Any], interval: float = 0.05):
+        self.outbox = outbox
+        self.template = template
+        self.interval = interval
+        self.parts: List[str] = []
+        self.offset = 0
+        self.last_post = 0.0
+
+    def __call__(self, chunk: str):
+        self.parts.append(chunk)
+        if time.monotonic() - self.last_post >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Post whatever has been buffered; call before the final response."""
+        if not self.parts:
+            return
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.outbox.post({**self.template, "text": text, "offset": self.offset, "ts": int(time.time())})
+        self.offset += len(text)
+        self.last_post = time.monotonic()
+
+    async def close(self):
+        """Post the buffered tail and wait until every chunk has been broadcast."""
+        self.flush()
+        await self.outbox.flush()
@@ -0,0 +1,161 @@
+import os
+import json
+import socket
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Channels carried between workers
+EVENTS_CHANNEL = "events"    # room events to fan out to local clients
+CONTROL_CHANNEL = "control"  # stop / allstop requests for sessions owned by any worker
+
+# Numbers a room event and publishes it in one step. Redis runs scripts atomically, so no other
+# event can be numbered in between and every worker receives events in seq order.
+# KEYS[1] = seq counter; ARGV = channel, origin (JSON), message (JSON)
+_PUBLISH_NUMBERED = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], '{"origin":' .. ARGV[2] .. ',"seq":' .. seq .. ',"message":' .. ARGV[3] .. '}')
+return seq
+"""
+
+class EventBus:
+    """Pub/sub between server workers. Subclasses decide how messages travel."""
+
+    distributed = False
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def on(self, channel: str, handler: Handler):
+        """Register a handler for messages on a channel (every worker registers the same ones)."""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def _dispatch(self, channel: str, message: Dict[str, Any]):
+        """Hand a message to this worker's handlers."""
+        self.delivered += 1
+        for handler in self.handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Event bus handler for '{channel}' failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend_name,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "delivered": self.delivered
+        }
+
+    @property
+    def backend_name(self) -> str:
+        return "base"
+
+class InProcessEventBus(EventBus):
+    """Single-worker bus: publishing calls the local handlers directly."""
+
+    @property
+    def backend_name(self) -> str:
+        return "memory"
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        self.published += 1
+        await self._dispatch(channel, message)
+
+class RedisEventBus(EventBus):
+    """Bus over a Redis-protocol server (Redis, Valkey, KeyDB) so several uvicorn workers share events and control."""
+
+    distributed = True
+
+    def __init__(self, url: str, prefix: str = "teamai"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("EVENT_BUS=redis requires the 'redis' package (pip install redis)")
+
+        self.url = url
+        self.prefix = prefix
+        self.redis = redis_asyncio.from_url(url)
+        self._publish_numbered = self.redis.register_script(_PUBLISH_NUMBERED)
+        self.listener_task: Optional[asyncio.Task] = None
+
+    @property
+    def backend_name(self) -> str:
+        return "redis"
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.prefix}:{channel}"
+
+    async def start(self):
+        self.listener_task = asyncio.create_task(self._listen())
+        logger.info(f"Redis event bus started ({self.url}, worker {self.worker_id})")
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            await asyncio.gather(self.listener_task, return_exceptions=True)
+        await self.redis.close()
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        if channel == EVENTS_CHANNEL and "seq" not in message:
+            # One sequence shared by all workers so resume_from works whichever worker a client reconnects to
+            await self._publish_numbered(
+                keys=[self._channel("seq")],
+                args=[self._channel(channel), json.dumps(self.worker_id), json.dumps(message)]
+            )
+        else:
+            envelope = json.dumps({"origin": self.worker_id, "message": message})
+            await self.redis.publish(self._channel(channel), envelope)
+        self.published += 1
+
+    async def _listen(self):
+        """Deliver messages from every worker (including this one) to local handlers, reconnecting on failure."""
+        channels = {self._channel(name): name for name in self.handlers}
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(*channels)
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    channel = item["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    envelope = json.loads(item["data"])
+                    message = envelope["message"]
+                    if "seq" in envelope:
+                        message = {**message, "seq": envelope["seq"]}
+                    await self._dispatch(channels[channel], message)
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                logger.error(f"Redis event bus listener error: {e}; reconnecting")
+                await pubsub.close()
+                await asyncio.sleep(1)
+
+def create_event_bus(settings_manager) -> EventBus:
+    """Build the bus selected by EVENT_BUS ('memory' or 'redis')."""
+    backend = settings_manager.get("event_bus", "memory")
+    if backend == "memory":
+        return InProcessEventBus()
+    if backend == "redis":
+        return RedisEventBus(settings_manager.get("redis_url"), settings_manager.get("event_bus_prefix"))
+    raise ValueError(f"Unknown EVENT_BUS backend: {backend}. Use 'memory' or 'redis'")
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional
+
+class ExpiringMap:
+    """Dict whose entries expire a fixed ttl after they were last written.
+
+    Entries stay ordered by deadline (every write moves the key to the end), so reap() only
+    touches what has actually expired. Nothing expires on read; a periodic reaper calls reap().
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, List[Any]]" = OrderedDict()  # key -> [deadline, value]
+        self.expired = 0
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._entries[key] = [self.clock() + self.ttl, value]
+        self._entries.move_to_end(key)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._entries[key][1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else default
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def reap(self, now: Optional[float] = None) -> List[Hashable]:
+        """Drop expired entries and return their keys."""
+        now = self.clock() if now is None else now
+        reaped = []
+        while self._entries:
+            key, (deadline, _) = next(iter(self._entries.items()))
+            if deadline > now:
+                break
+            self._entries.popitem(last=False)
+            reaped.append(key)
+        self.expired += len(reaped)
+        return reaped
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "ttl_seconds": self.ttl, "expired": self.expired}
+
+class ExpiringSet(ExpiringMap):
+    """Set of keys that expire a fixed ttl after they were (re-)added."""
+
+    def add(self, key: Hashable):
+        self[key] = True
+
+    def discard(self, key: Hashable):
+        self.pop(key)
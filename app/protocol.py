@@ -0,0 +1,143 @@
+import logging
+from typing import Any, Dict, List, Literal, Optional, Union
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ("json", "msgpack")
+
+# Outbound room events, tagged by "type". Validated once when they enter ConnectionManager.
+
+class Event(msgspec.Struct, tag_field="type", kw_only=True, omit_defaults=True, forbid_unknown_fields=True):
+    """Base for room events. seq is stamped by ConnectionManager; unset optional fields are omitted."""
+    ts: int
+    seq: Optional[int] = None
+
+class HumanMessage(Event, tag="human_message"):
+    sender: str
+    target: str
+    thread: str
+    text: str
+    call_id: Optional[str] = None
+    judge: Optional[str] = None
+
+class AgentResponse(Event, tag="agent_response"):
+    sender: str
+    target: str
+    text: str
+    thread: Optional[str] = None
+    call_id: Optional[str] = None
+    session_id: Optional[str] = None
+    round: Optional[int] = None
+    final: bool = False
+    handoff: Optional[Dict[str, Any]] = None
+    panel_role: Optional[Literal["panelist", "judge"]] = None
+
+class AgentDelta(Event, tag="agent_delta"):
+    """A chunk of an agent's reply while it streams; the agent_response that follows replaces it."""
+    sender: str
+    text: str
+    offset: int = 0  # where this chunk starts in the full reply
+    thread: Optional[str] = None
+    call_id: Optional[str] = None
+    session_id: Optional[str] = None
+    round: Optional[int] = None
+
+class CollaborationStarted(Event, tag="collaboration_started"):
+    session_id: str
+    goal: str
+    mode: str
+    initial_speaker: str
+    thread: Optional[str] = None
+
+class CollaborationEnded(Event, tag="collaboration_ended"):
+    session_id: str
+    reason: str
+    thread: Optional[str] = None
+
+class SystemNotice(Event, tag="system_notice"):
+    text: str
+    thread: Optional[str] = None
+    session_id: Optional[str] = None
+
+class ErrorEvent(Event, tag="error"):
+    text: str
+    thread: Optional[str] = None
+    session_id: Optional[str] = None
+    sender: Optional[str] = None   # the agent whose call failed
+    call_id: Optional[str] = None
+
+EVENT_TYPES = {
+    cls.__struct_config__.tag: cls
+    for cls in (HumanMessage, AgentResponse, AgentDelta, CollaborationStarted, CollaborationEnded, SystemNotice, ErrorEvent)
+}
+
+# Inbound client messages, validated as they are read off the socket
+
+class ClientMessage(msgspec.Struct, tag_field="type"):
+    pass
+
+class HumanMessageIn(ClientMessage, tag="human_message"):
+    text: str
+    target: str = "router"
+    thread: str = "default"
+    judge: Optional[str] = None  # panel mode: agent that merges the panel's answers
+
+class StartCollaboration(ClientMessage, tag="start_collaboration"):
+    session_id: str
+    goal: str
+    initial_speaker: Optional[str] = None  # default: first configured agent
+    mode: Literal["collaborate", "autopilot"] = "collaborate"
+    max_rounds: Optional[int] = None
+    thread: str = "default"
+
+class StopCollaboration(ClientMessage, tag="stop_collaboration"):
+    session_id: Optional[str] = None
+
+class Subscribe(ClientMessage, tag="subscribe"):
+    topics: List[str] = []
+    resume_from: Optional[int] = None
+
+class Unsubscribe(ClientMessage, tag="unsubscribe"):
+    topics: List[str] = []
+
+class Hello(ClientMessage, tag="hello"):
+    encoding: Literal["json", "msgpack"] = "json"
+
+class Pong(ClientMessage, tag="pong"):
+    pass
+
+ClientMessageUnion = Union[
+    HumanMessageIn, StartCollaboration, StopCollaboration, Subscribe, Unsubscribe, Hello, Pong
+]
+
+_json_encoder = msgspec.json.Encoder()
+_msgpack_encoder = msgspec.msgpack.Encoder()
+_json_decoder = msgspec.json.Decoder(ClientMessageUnion)
+_msgpack_decoder = msgspec.msgpack.Decoder(ClientMessageUnion)
+
+def decode_client_message(data: Union[str, bytes], encoding: str = "json") -> Dict[str, Any]:
+    """Decode and validate an inbound frame. Raises msgspec.DecodeError/ValidationError on bad input."""
+    if encoding == "msgpack" and isinstance(data, bytes):
+        message = _msgpack_decoder.decode(data)
+    else:
+        message = _json_decoder.decode(data)
+    return msgspec.to_builtins(message)
+
+def to_event(message: Dict[str, Any]) -> Union[Event, Dict[str, Any]]:
+    """Validate a router event dict against its schema. Types outside the schema pass through as dicts."""
+    event_type = EVENT_TYPES.get(message.get("type"))
+    if event_type is None:
+        return message
+    try:
+        return msgspec.convert(message, event_type)
+    except msgspec.ValidationError as e:
+        # Never drop a room event over a schema mismatch; report it and send it as-is
+        logger.error(f"Event failed schema validation ({message.get('type')}): {e}")
+        return message
+
+def encode_json(event: Union[Event, Dict[str, Any]]) -> str:
+    return _json_encoder.encode(event).decode()
+
+def encode_msgpack(event: Union[Event, Dict[str, Any]]) -> bytes:
+    return _msgpack_encoder.encode(event)
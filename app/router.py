@@ -1,38 +1,90 @@
 import asyncio
-import json
 import logging
 import time
 import uuid
 import re
-from typing import Dict, Any, Callable, Optional, Set
+from typing import Dict, Any, Callable, Optional, Tuple
+from .dispatcher import DeltaStream, SessionOutbox
+from .connectors.base import ConnectorReply, LatencyStats, Usage, UsageLedger, unwrap_reply
+from .session import CollaborationSession, TranscriptSpill
+from .scheduler import Reservation, TurnScheduler
+from .expiry import ExpiringMap, ExpiringSet
 
 logger = logging.getLogger(__name__)
 
+class SessionDeadlineExceeded(Exception):
+    """Raised when a session's time budget runs out while an agent call is in flight."""
+
 class Router:
     """Routes messages between agents and manages collaboration sessions."""
     
     def __init__(self, settings_manager):
         self.settings_manager = settings_manager
-        self.hop_counts = {}  # Track hops per conversation
-        self.collaboration_sessions = {}  # Track active collaboration sessions
-        self.allstop_requests: Set[str] = set()  # Track allstop requests to ignore in-flight responses
-        self.call_depth: Dict[str, int] = {}  # Track recursion depth per session
+        # Bookkeeping that would otherwise grow forever expires and is swept by one reaper task
+        self.hop_counts = ExpiringMap(settings_manager.get("hop_count_ttl", 600))  # Track hops per conversation
+        self.collaboration_sessions: Dict[str, CollaborationSession] = {}  # Track active collaboration sessions
+        self.allstop_requests = ExpiringSet(settings_manager.get("ended_session_ttl", 3))  # Ignore in-flight responses
+        self.ended_sessions = ExpiringSet(settings_manager.get("ended_session_ttl", 3))  # Ended, kept briefly for inspection
+        self.reaper_interval = settings_manager.get("reaper_interval", 1.0)
+        self.reaper_task: Optional[asyncio.Task] = None
+        self.session_drivers: Dict[str, asyncio.Task] = {}  # One turn-driver task per collaboration session
+        self.inflight_calls: Dict[str, Dict[str, Any]] = {}  # Provider request currently running per session
+        self.session_outboxes: Dict[str, SessionOutbox] = {}  # Ordered, non-blocking broadcasts per session
+        self.turn_reservations: Dict[str, Dict[str, Any]] = {}  # Next turn, queued as soon as a streaming reply names it
+        self.reservation_stats = {"used": 0, "cancelled": 0}
+        
+        # Each session keeps a fixed-size context window; older turns are dropped or spilled to disk
+        self.context_window = settings_manager.get("session_context_window", 8)
+        spill_dir = settings_manager.get("transcript_spill_dir")
+        self.transcript_spill = TranscriptSpill(spill_dir) if spill_dir else None
+        self.cancellation_stats = {
+            "cancelled_calls": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "output_tokens_saved_max": 0  # upper bound: the max_tokens budget of each aborted call
+        }
+        
+        # Token accounting from provider-reported usage
+        self.model_prices = settings_manager.get("model_prices") or {}
+        self.usage = UsageLedger(self.model_prices)
+        
+        # Streamed replies go out as agent_delta events; time to first token is tracked per agent
+        self.delta_interval = settings_manager.get("delta_flush_interval", 0.05)
+        self.latency = LatencyStats()
         
         # Emergency safeguards
         self.max_turns_emergency = 200
         self.max_tokens_emergency = 200000
         self.max_elapsed_minutes = 20
         self.soft_warn_interval = 25
-        self.max_call_depth = 50  # Prevent infinite recursion
-        
-        # Import connectors here to avoid circular imports
-        from .connectors.openai_conn import OpenAIConnector
-        from .connectors.anthropic_conn import AnthropicConnector
         
-        self.connectors = {
-            "gpt": OpenAIConnector(settings_manager),
-            "claude": AnthropicConnector(settings_manager)
+        # One scheduler admits agent turns for every session: human calls first, then fair shares
+        self.scheduler = TurnScheduler(settings_manager.get("max_concurrent_turns", 8))
+        self.session_weights = {
+            "collaborate": settings_manager.get("scheduler_weight_collaborate", 2.0),
+            "autopilot": settings_manager.get("scheduler_weight_autopilot", 1.0)
         }
+        
+        # Agents come from AGENTS_CONFIG (default: gpt + claude); the routing table says who may follow whom
+        from .connectors.registry import RoutingTable, build_connectors, load_agent_specs
+        from .connectors.http_pool import HttpPools
+        self.agents = load_agent_specs(settings_manager)
+        self.routing = RoutingTable(self.agents)
+        self.http_pools = HttpPools(settings_manager)  # warmed at startup, closed at shutdown
+        self.connectors, self.rate_limiters, self.resilience = build_connectors(
+            self.agents, self.routing, settings_manager, self.http_pools
+        )
+        
+        # Optional cache for repeated single-mode questions (collaboration turns always go to the provider)
+        self.response_cache = None
+        if settings_manager.get("response_cache", False):
+            from .connectors.response_cache import ResponseCache
+            self.response_cache = ResponseCache(
+                max_entries=settings_manager.get("response_cache_size", 1000),
+                ttl=settings_manager.get("response_cache_ttl", 3600.0),
+                path=settings_manager.get("response_cache_path") or None,
+                force=settings_manager.get("response_cache_force", False)
+            )
     
     async def process_event(self, event: Dict[str, Any], broadcast_fn: Callable):
         """Process an incoming event and route to appropriate handler."""
@@ -52,6 +104,7 @@ class Router:
             logger.error(f"Error processing event: {e}")
             error_event = {
                 "type": "error",
+                "thread": event.get("thread", "default"),
                 "text": f"Error processing message: {str(e)}",
                 "ts": int(time.time())
             }
@@ -69,10 +122,14 @@ class Router:
         target = event.get("target")
         call_id = event.get("call_id", str(uuid.uuid4()))
         
+        if target == "panel":
+            await self._handle_panel(event, broadcast_fn)
+            return
+        
         # Initialize hop count for this conversation
         self.hop_counts[call_id] = 0
         
-        if target in ["gpt", "claude"]:
+        if target in self.connectors:
             # Create agent_call event
             agent_call = {
                 "type": "agent_call",
@@ -89,113 +146,168 @@ class Router:
             # Invalid target
             error_event = {
                 "type": "error",
-                "text": f"Invalid target: {target}. Use @gpt or @claude",
+                "thread": event.get("thread", "default"),
+                "text": f"Invalid target: {target}. Use {', '.join('@' + name for name in self.connectors)} or @panel",
                 "ts": int(time.time())
             }
             await broadcast_fn(error_event)
     
     async def _handle_agent_call(self, event: Dict[str, Any], broadcast_fn: Callable):
-        """Handle an agent call by invoking the appropriate connector."""
+        """Handle a single-mode agent call by invoking the appropriate connector."""
         target = event.get("target")
         call_id = event.get("call_id", "")
-        session_id = event.get("session_id")
         
-        # Check if this call should be ignored due to allstop
-        if session_id:
-            if session_id in self.allstop_requests:
-                logger.info(f"Ignoring agent call for stopped session {session_id}")
-                return
-            
-            # Check if session is ended
-            session = self.collaboration_sessions.get(session_id)
-            if not session or session.get("status") == "ended":
-                logger.info(f"Ignoring agent call for ended session {session_id}")
-                return
-                
-            # Recursion depth protection
-            current_depth = self.call_depth.get(session_id, 0)
-            if current_depth >= self.max_call_depth:
-                logger.error(f"Maximum call depth ({self.max_call_depth}) exceeded for session {session_id}")
-                await self._end_collaboration_session(session_id, f"Maximum call depth exceeded", broadcast_fn)
-                return
-            
-            self.call_depth[session_id] = current_depth + 1
+        if event.get("session_id"):
+            # Collaboration turns are run by the session's driver task, not by agent_call events
+            logger.warning(f"Ignoring agent_call for session {event['session_id']}")
+            return
         
         # Check hop limit for single mode
-        if not session_id:
-            current_hops = self.hop_counts.get(call_id, 0)
-            if current_hops >= 1:
-                logger.warning(f"Hop limit reached for call {call_id}")
-                return
-            self.hop_counts[call_id] = current_hops + 1
+        current_hops = self.hop_counts.get(call_id, 0)
+        if current_hops >= 1:
+            logger.warning(f"Hop limit reached for call {call_id}")
+            return
+        self.hop_counts[call_id] = current_hops + 1
         
         if target not in self.connectors:
             error_event = {
                 "type": "error",
+                "thread": event.get("thread", "default"),
                 "text": f"Unknown agent: {target}",
                 "ts": int(time.time())
             }
             await broadcast_fn(error_event)
             return
         
-        # Get session context if in collaboration mode
-        session_context = None
-        if session_id:
-            session_context = self._get_session_context(session_id)
-            if not session_context:
-                logger.warning(f"Session {session_id} not found")
-                return
-        
         # Call the connector
-        connector = self.connectors[target]
         start_time = time.time()
         
         try:
-            if session_context:
-                response = await connector.process_collaboration_message(
-                    event.get("text", ""), 
-                    session_context
-                )
-            else:
-                response = await connector.process_message(event.get("text", ""))
+            thread = event.get("thread", "default")
+            deltas = self._delta_stream(SessionOutbox(broadcast_fn, call_id), sender=target, thread=thread, call_id=call_id)
+            try:
+                reply = await self._ask_single(target, event.get("text", ""), f"thread:{thread}", deltas)
+            finally:
+                # Every chunk is out before the final response (or error) replaces them
+                await deltas.close()
+            response, usage = unwrap_reply(reply)
+            self._record_usage(usage)
+            self.latency.record(target, reply)
             
             latency_ms = int((time.time() - start_time) * 1000)
             logger.info(f"Agent {target} responded in {latency_ms}ms")
             
-            # Double-check if session was stopped while processing
-            if session_id:
-                if session_id in self.allstop_requests:
-                    logger.info(f"Discarding response for stopped session {session_id}")
-                    return
-                    
-                session = self.collaboration_sessions.get(session_id)
-                if not session or session.get("status") == "ended":
-                    logger.info(f"Discarding response for ended session {session_id}")
-                    return
-            
-            # Handle collaboration response
-            if session_context:
-                await self._handle_collaboration_response(
-                    session_id, target, response, broadcast_fn
-                )
-            else:
-                # Handle single mode response
-                await self._handle_single_response(
-                    event, target, response, broadcast_fn
-                )
+            await self._handle_single_response(event, target, response, broadcast_fn)
                 
         except Exception as e:
             logger.error(f"Error calling {target}: {e}")
             error_event = {
                 "type": "error",
+                "thread": event.get("thread", "default"),
                 "text": f"Error from {target}: {str(e)}",
+                "sender": target,
+                "call_id": call_id,
                 "ts": int(time.time())
             }
             await broadcast_fn(error_event)
-        finally:
-            # Decrement call depth
-            if session_id and session_id in self.call_depth:
-                self.call_depth[session_id] = max(0, self.call_depth[session_id] - 1)
+    
+    async def _ask_single(self, name: str, text: str, flow: str, on_delta: Callable[[str], None]) -> Any:
+        """One single-mode turn for an agent, answered from the response cache when it can be."""
+        connector = self.connectors[name]
+        cache = self.response_cache
+        spec = getattr(connector, "spec", None)
+        key = None
+        if cache is not None and spec is not None and cache.cacheable(spec.temperature):
+            key = cache.key(spec.provider, spec.model, getattr(connector, "base_system_prompt", ""), spec.temperature, text)
+            content = await cache.get(key)
+            if content is not None:
+                # Served locally: no turn slot, no tokens, nothing to stream
+                logger.info(f"Agent {name} answered from the response cache")
+                return ConnectorReply(content)
+        
+        async with self.scheduler.turn(flow, lane="interactive"):
+            reply = await connector.process_message(text, on_delta=on_delta)
+        if key is not None:
+            await cache.put(key, unwrap_reply(reply)[0])
+        return reply
+    
+    async def _handle_panel(self, event: Dict[str, Any], broadcast_fn: Callable):
+        """Panel mode: ask every agent the same question at once and post each answer as it arrives."""
+        text = event.get("text", "")
+        thread = event.get("thread", "default")
+        call_id = event.get("call_id", str(uuid.uuid4()))
+        judge = event.get("judge") or self.settings_manager.get("panel_judge")
+        
+        if judge and judge not in self.connectors:
+            await broadcast_fn({
+                "type": "error",
+                "thread": thread,
+                "text": f"Unknown judge: {judge}",
+                "ts": int(time.time())
+            })
+            return
+        
+        async def ask(name: str) -> Optional[str]:
+            answer = await self._ask_panel_agent(name, text, thread, call_id, "panelist", broadcast_fn)
+            return f"[{name}]: {answer}" if answer is not None else None
+        
+        # Wall-clock cost is the slowest agent, not the sum
+        start_time = time.time()
+        answers = [a for a in await asyncio.gather(*(ask(name) for name in self.connectors)) if a is not None]
+        logger.info(f"Panel of {len(self.connectors)} answered in {int((time.time() - start_time) * 1000)}ms")
+        
+        if judge and len(answers) > 1:
+            merge_prompt = (
+                f"Question: {text}\n\n"
+                f"Answers from the panel:\n\n" + "\n\n".join(answers) + "\n\n"
+                "Merge these into the single best answer. Briefly note any point where they disagree. "
+                "Answer in plain text."
+            )
+            await self._ask_panel_agent(judge, merge_prompt, thread, call_id, "judge", broadcast_fn)
+    
+    async def _ask_panel_agent(self, name: str, text: str, thread: str, call_id: str, role: str,
+                               broadcast_fn: Callable) -> Optional[str]:
+        """Run one panel call and broadcast its answer. Returns the answer text, or None if the call failed."""
+        deltas = self._delta_stream(SessionOutbox(broadcast_fn, f"{call_id}:{name}"),
+                                    sender=name, thread=thread, call_id=call_id)
+        try:
+            reply = await self._ask_single(name, text, f"thread:{thread}", deltas)
+        except Exception as e:
+            await deltas.close()
+            logger.error(f"Error calling {name} in panel: {e}")
+            await broadcast_fn({
+                "type": "error",
+                "thread": thread,
+                "text": f"Error from {name}: {str(e)}",
+                "sender": name,
+                "call_id": call_id,
+                "ts": int(time.time())
+            })
+            return None
+        
+        await deltas.close()
+        response, usage = unwrap_reply(reply)
+        self._record_usage(usage)
+        self.latency.record(name, reply)
+        
+        response_event = {
+            "type": "agent_response",
+            "sender": name,
+            "target": "all",
+            "thread": thread,
+            "ts": int(time.time()),
+            "call_id": call_id,
+            "panel_role": role
+        }
+        if isinstance(response, dict) and "handoff" in response:
+            # Handoffs are not followed in panel mode; everyone is already answering
+            handoff = response["handoff"]
+            response_event["text"] = f"[Suggests asking {handoff.get('to')}: {handoff.get('task')}]"
+        else:
+            response_event["text"] = str(response)
+        
+        await broadcast_fn(response_event)
+        return response_event["text"]
     
     async def _handle_single_response(self, original_event: Dict[str, Any], sender: str, response: Any, broadcast_fn: Callable):
         """Handle a response in single mode."""
@@ -221,7 +333,7 @@ class Router:
             await broadcast_fn(handoff_event)
             
             # Create new agent call for handoff target
-            if handoff_target in ["gpt", "claude"] and handoff_target != sender:
+            if self.routing.can_hand_off(sender, handoff_target):
                 handoff_call = {
                     "type": "agent_call",
                     "sender": "router",
@@ -249,75 +361,262 @@ class Router:
         """Start a new collaboration session."""
         session_id = event.get("session_id")
         goal = event.get("goal")
-        initial_speaker = event.get("initial_speaker", "gpt")
+        initial_speaker = event.get("initial_speaker") or self.routing.first
         mode = event.get("mode", "collaborate")
+        thread = event.get("thread", "default")
         max_rounds = event.get("max_rounds")
         
         if not session_id or not goal:
             error_event = {
                 "type": "error",
+                "thread": thread,
                 "text": "Missing session_id or goal for collaboration",
                 "ts": int(time.time())
             }
             await broadcast_fn(error_event)
             return
         
+        if initial_speaker not in self.connectors:
+            error_event = {
+                "type": "error",
+                "thread": thread,
+                "text": f"Unknown agent: {initial_speaker}",
+                "ts": int(time.time())
+            }
+            await broadcast_fn(error_event)
+            return
+        
         # Create session
-        session = {
-            "id": session_id,
-            "goal": goal,
-            "mode": mode,
-            "initial_speaker": initial_speaker,
-            "current_speaker": initial_speaker,
-            "max_rounds": max_rounds,
-            "round": 1,
-            "status": "active",
-            "started_at": time.time(),
-            "transcript": [],
-            "total_tokens": 0
-        }
+        session = CollaborationSession(
+            session_id, thread, goal, mode, initial_speaker, max_rounds,
+            context_window=self.context_window,
+            usage=UsageLedger(self.model_prices),
+            spill=self.transcript_spill
+        )
         
         self.collaboration_sessions[session_id] = session
         
         # Remove from allstop requests if it was there
         self.allstop_requests.discard(session_id)
+        self.ended_sessions.discard(session_id)
         
         # Broadcast start event
         start_event = {
             "type": "collaboration_started",
             "session_id": session_id,
+            "thread": thread,
             "goal": goal,
             "mode": mode,
             "initial_speaker": initial_speaker,
             "ts": int(time.time())
         }
         await broadcast_fn(start_event)
+        self.session_outboxes[session_id] = SessionOutbox(broadcast_fn, session_id)
         
-        # Start the collaboration by calling the initial speaker
-        agent_call = {
-            "type": "agent_call",
-            "sender": "router",
-            "target": initial_speaker,
-            "session_id": session_id,
-            "text": goal,
-            "ts": int(time.time()),
-            "call_id": f"collab_{session_id}_{session['round']}"
+        # Run the session in its own driver task; this call returns when the session ends
+        driver = asyncio.create_task(self._run_collaboration(session_id, broadcast_fn))
+        self.session_drivers[session_id] = driver
+        try:
+            await asyncio.wait({driver})
+        except asyncio.CancelledError:
+            driver.cancel()
+            raise
+    
+    def _is_session_active(self, session_id: str) -> bool:
+        """True while a session exists, is not ended and has not been stopped."""
+        if session_id in self.allstop_requests:
+            return False
+        session = self.collaboration_sessions.get(session_id)
+        return bool(session) and session.status == "active"
+    
+    async def _run_collaboration(self, session_id: str, broadcast_fn: Callable):
+        """Drive a collaboration session turn by turn in one long-lived task (constant stack depth)."""
+        session = self.collaboration_sessions[session_id]
+        speaker = session.initial_speaker
+        task = session.goal
+        
+        try:
+            while self._is_session_active(session_id):
+                session.state = "calling"
+                session.current_speaker = speaker
+                response = await self._call_collaboration_agent(session_id, speaker, task)
+                
+                # The session may have been stopped while the agent was working
+                if not self._is_session_active(session_id):
+                    logger.info(f"Discarding response for ended session {session_id}")
+                    return
+                
+                session.state = "responding"
+                next_turn = await self._handle_collaboration_response(session_id, speaker, response, broadcast_fn)
+                if next_turn is None:
+                    return
+                speaker, task = next_turn
+                
+        except asyncio.CancelledError:
+            logger.info(f"Driver for session {session_id} cancelled")
+            raise
+        except SessionDeadlineExceeded:
+            await self._end_collaboration_session(
+                session_id, f"Emergency stop: {self.max_elapsed_minutes} minutes elapsed", broadcast_fn
+            )
+        except Exception as e:
+            logger.error(f"Error calling {speaker} in session {session_id}: {e}")
+            error_event = {
+                "type": "error",
+                "thread": session.thread,
+                "session_id": session_id,
+                "text": f"Error from {speaker}: {str(e)}",
+                "ts": int(time.time())
+            }
+            await self._post_session_event(session_id, error_event, broadcast_fn)
+            await self._end_collaboration_session(session_id, f"Error from {speaker}", broadcast_fn)
+        finally:
+            self._take_reservation(session_id, None)
+            if self.session_drivers.get(session_id) is asyncio.current_task():
+                del self.session_drivers[session_id]
+    
+    async def _call_collaboration_agent(self, session_id: str, target: str, text: str) -> Any:
+        """Run one collaboration turn against a connector."""
+        if target not in self.connectors:
+            raise ValueError(f"Unknown agent: {target}")
+        
+        connector = self.connectors[target]
+        session_context = self._get_session_context(session_id)
+        session = self.collaboration_sessions[session_id]
+        weight = self.session_weights.get(session.mode, 1.0)
+        start_time = time.time()
+        # Chunks share the session's outbox, so they always precede this turn's agent_response
+        outbox = self.session_outboxes.get(session_id)
+        deltas = outbox and self._delta_stream(
+            outbox, sender=target, thread=session.thread, session_id=session_id, round=session.round
+        )
+        reservation = self._take_reservation(session_id, target)
+        
+        def on_handoff(agent: str):
+            # The reply names the next speaker while it is still streaming: start queuing that turn now
+            if self.routing.can_hand_off(target, agent) and session_id not in self.turn_reservations:
+                self.turn_reservations[session_id] = {
+                    "agent": agent,
+                    "reservation": self.scheduler.reserve(f"session:{session_id}", "background", weight)
+                }
+        
+        # The provider request runs as its own task so stop/allstop/emergency can abort it mid-flight,
+        # including while it is still queued for a scheduler slot
+        call_task = asyncio.create_task(self.scheduler.run(
+            f"session:{session_id}",
+            lambda: connector.process_collaboration_message(
+                text, session_context, on_delta=deltas, on_handoff=on_handoff
+            ),
+            lane="background",
+            weight=weight,
+            reservation=reservation
+        ))
+        call = {
+            "task": call_task,
+            "agent": target,
+            "started_at": start_time,
+            "max_tokens": getattr(connector, "collaboration_max_tokens", 0),
+            "cancel_requested_at": None
         }
+        self.inflight_calls[session_id] = call
+        call_task.add_done_callback(lambda task: self._on_inflight_done(session_id, call))
+        if reservation is not None:
+            # A run() cancelled before its first step never sees its reservation; give it up here (a no-op once admitted)
+            call_task.add_done_callback(lambda task: self.scheduler.cancel_reservation(reservation))
+        
+        # Never wait past the session's time budget
+        remaining = self.max_elapsed_minutes * 60 - (time.time() - session.started_at)
+        try:
+            done, _ = await asyncio.wait({call_task}, timeout=max(remaining, 0))
+        except asyncio.CancelledError:
+            self._cancel_inflight(session_id)
+            raise
+        if not done:
+            self._cancel_inflight(session_id)
+            raise SessionDeadlineExceeded()
+        
+        if deltas:
+            deltas.flush()
+        reply = call_task.result()
+        response, usage = unwrap_reply(reply)
+        self._record_usage(usage, session)
+        self.latency.record(target, reply)
+        latency_ms = int((time.time() - start_time) * 1000)
+        logger.info(f"Agent {target} responded in {latency_ms}ms (session {session_id})")
+        return response
+    
+    def _take_reservation(self, session_id: str, agent: Optional[str]) -> Optional[Reservation]:
+        """The turn queued early for this session if it is for this agent; any other reservation is given up."""
+        reserved = self.turn_reservations.pop(session_id, None)
+        if reserved is None:
+            return None
+        if reserved["agent"] == agent:
+            self.reservation_stats["used"] += 1
+            return reserved["reservation"]
+        self.scheduler.cancel_reservation(reserved["reservation"])
+        self.reservation_stats["cancelled"] += 1
+        return None
+    
+    def _delta_stream(self, outbox: SessionOutbox, **fields) -> DeltaStream:
+        """agent_delta publisher for one call; fields identify the reply the chunks belong to."""
+        return DeltaStream(outbox, {"type": "agent_delta", **fields}, self.delta_interval)
+    
+    def _record_usage(self, usage: Optional[Usage], session: Optional[CollaborationSession] = None):
+        """Add a call's reported tokens to the global totals and, for collaboration turns, to its session."""
+        if usage is None:
+            return
+        self.usage.add(usage)
+        if session is not None:
+            session.usage.add(usage)
+            session.total_tokens = session.usage.total_tokens
+    
+    def _cancel_inflight(self, session_id: str) -> bool:
+        """Abort the provider request a session is waiting on, if any."""
+        call = self.inflight_calls.get(session_id)
+        if not call or call["task"].done():
+            return False
+        call["cancel_requested_at"] = time.perf_counter()
+        call["task"].cancel()
+        return True
+    
+    def _on_inflight_done(self, session_id: str, call: Dict[str, Any]):
+        """Forget a finished provider request and record cancellation latency for aborted ones."""
+        if self.inflight_calls.get(session_id) is call:
+            del self.inflight_calls[session_id]
+        
+        if not call["task"].cancelled() or call["cancel_requested_at"] is None:
+            return
         
-        await self._handle_agent_call(agent_call, broadcast_fn)
+        latency_ms = (time.perf_counter() - call["cancel_requested_at"]) * 1000
+        stats = self.cancellation_stats
+        stats["cancelled_calls"] += 1
+        stats["total_latency_ms"] += latency_ms
+        stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+        stats["output_tokens_saved_max"] += call["max_tokens"]
+        logger.info(
+            f"Cancelled in-flight {call['agent']} call for session {session_id} in {latency_ms:.1f}ms "
+            f"({time.time() - call['started_at']:.1f}s into the request, up to {call['max_tokens']} output tokens saved)"
+        )
+    
+    def cancellation_report(self) -> Dict[str, Any]:
+        """Cancellation counters for the health endpoint."""
+        stats = self.cancellation_stats
+        count = stats["cancelled_calls"]
+        return {
+            "cancelled_calls": count,
+            "avg_latency_ms": round(stats["total_latency_ms"] / count, 2) if count else 0.0,
+            "max_latency_ms": round(stats["max_latency_ms"], 2),
+            "output_tokens_saved_max": stats["output_tokens_saved_max"],
+            "in_flight": len(self.inflight_calls)
+        }
     
-    async def _handle_collaboration_response(self, session_id: str, sender: str, response: Any, broadcast_fn: Callable):
-        """Handle a response in collaboration mode."""
+    async def _handle_collaboration_response(self, session_id: str, sender: str, response: Any,
+                                             broadcast_fn: Callable) -> Optional[Tuple[str, str]]:
+        """Handle a response in collaboration mode. Returns the next (speaker, task), or None when the session ends."""
         session = self.collaboration_sessions.get(session_id)
         if not session:
             logger.warning(f"Session {session_id} not found during response handling")
-            return
-        
-        # Safety check: prevent infinite loops
-        if session["round"] > self.max_turns_emergency:
-            logger.error(f"Emergency stop: too many rounds in session {session_id}")
-            await self._end_collaboration_session(session_id, f"Emergency stop: {self.max_turns_emergency} rounds reached", broadcast_fn)
-            return
+            return None
 
         # Parse collaboration response
         if isinstance(response, dict):
@@ -331,12 +630,7 @@ class Router:
             final = False
         
         # Add to transcript
-        session["transcript"].append({
-            "sender": sender,
-            "message": message,
-            "round": session["round"],
-            "ts": int(time.time())
-        })
+        session.add_turn(sender, message)
         
         # Broadcast the response
         response_event = {
@@ -344,18 +638,20 @@ class Router:
             "sender": sender,
             "target": "all",
             "session_id": session_id,
-            "round": session["round"],
+            "thread": session.thread,
+            "round": session.round,
             "text": message,
             "final": final,
             "ts": int(time.time())
         }
-        await broadcast_fn(response_event)
+        # Fan-out runs behind the next agent call instead of in front of it
+        await self._post_session_event(session_id, response_event, broadcast_fn)
         
         # Check emergency safeguards before continuing
         emergency_reason = self._check_emergency_safeguards(session)
         if emergency_reason:
             await self._end_collaboration_session(session_id, emergency_reason, broadcast_fn)
-            return
+            return None
         
         # Check if collaboration should continue
         should_continue = self._should_continue_collaboration(session, handoff, final)
@@ -364,61 +660,54 @@ class Router:
             reason = "Collaboration completed"
             if final:
                 reason = "Agent indicated completion"
-            elif session["mode"] == "collaborate" and session["round"] >= session.get("max_rounds", 6):
+            elif session.mode == "collaborate" and session.round >= (session.max_rounds or 6):
                 reason = "Maximum rounds reached"
-            elif not handoff and session["mode"] == "collaborate":
+            elif not handoff and session.mode == "collaborate":
                 reason = "No handoff provided in bounded mode"
                 
             await self._end_collaboration_session(session_id, reason, broadcast_fn)
-            return
+            return None
         
         # Continue collaboration - increment round BEFORE next call
-        session["round"] += 1
-        
-        # Additional safety check after increment
-        if session["round"] > self.max_turns_emergency:
-            logger.error(f"Round limit exceeded after increment: {session['round']}")
-            await self._end_collaboration_session(session_id, f"Round limit exceeded: {session['round']}", broadcast_fn)
-            return
+        session.round += 1
         
         # Determine next speaker
-        if handoff and handoff.get("to") in ["gpt", "claude"]:
+        if handoff and self.routing.can_hand_off(sender, handoff.get("to")):
             next_speaker = handoff["to"]
-            next_task = handoff.get("task", session["goal"])
+            next_task = handoff.get("task", session.goal)
         else:
-            # Auto-alternate in autopilot mode
-            next_speaker = "claude" if sender == "gpt" else "gpt"
-            next_task = session["goal"]
+            # No valid handoff: the routing table's next speaker takes the turn
+            next_speaker = self.routing.next_speaker(sender)
+            next_task = session.goal
         
-        session["current_speaker"] = next_speaker
+        session.current_speaker = next_speaker
         
         # Check soft warning
-        if session["round"] % self.soft_warn_interval == 0:
+        if session.round % self.soft_warn_interval == 0:
             warning_event = {
                 "type": "system_notice",
-                "text": f"Collaboration has been running for {session['round']} rounds. Consider saying 'Allstop' if complete.",
+                "session_id": session_id,
+                "thread": session.thread,
+                "text": f"Collaboration has been running for {session.round} rounds. Consider saying 'Allstop' if complete.",
                 "ts": int(time.time())
             }
-            await broadcast_fn(warning_event)
+            await self._post_session_event(session_id, warning_event, broadcast_fn)
         
-        # Final safety check before making next agent call
+        # Final safety check before handing the next turn back to the driver
         if session_id in self.allstop_requests:
             logger.info(f"Session {session_id} was stopped before next agent call")
-            return
-            
-        # Call next agent
-        agent_call = {
-            "type": "agent_call",
-            "sender": "router",
-            "target": next_speaker,
-            "session_id": session_id,
-            "text": next_task,
-            "ts": int(time.time()),
-            "call_id": f"collab_{session_id}_{session['round']}"
-        }
+            return None
         
-        logger.info(f"Making next agent call for round {session['round']} to {next_speaker}")
-        await self._handle_agent_call(agent_call, broadcast_fn)
+        logger.info(f"Next turn for round {session.round} goes to {next_speaker}")
+        return next_speaker, next_task
+    
+    async def _post_session_event(self, session_id: str, event: Dict[str, Any], broadcast_fn: Callable):
+        """Hand a session event to its outbox; broadcast directly once the session has none."""
+        outbox = self.session_outboxes.get(session_id)
+        if outbox:
+            outbox.post(event)
+        else:
+            await broadcast_fn(event)
     
     async def _handle_stop_collaboration(self, event: Dict[str, Any], broadcast_fn: Callable):
         """Stop a collaboration session."""
@@ -443,25 +732,47 @@ class Router:
             
         await self._end_collaboration_session(session_id, "Stopped by user", broadcast_fn)
     
-    async def _handle_allstop_from_text(self, broadcast_fn: Callable):
+    async def _handle_allstop_from_text(self, broadcast_fn: Callable, notify_if_idle: bool = True,
+                                        reason: str = "Allstop command") -> int:
         """Handle allstop command from chat text."""
         # Find and stop all active sessions
         active_sessions = [
             session_id for session_id, session in self.collaboration_sessions.items()
-            if session.get("status") == "active"
+            if session.status == "active"
         ]
         
         if not active_sessions:
-            notice_event = {
-                "type": "system_notice",
-                "text": "No active collaboration session to stop.",
-                "ts": int(time.time())
-            }
-            await broadcast_fn(notice_event)
-            return
+            if notify_if_idle:
+                notice_event = {
+                    "type": "system_notice",
+                    "text": "No active collaboration session to stop.",
+                    "ts": int(time.time())
+                }
+                await broadcast_fn(notice_event)
+            return 0
         
         for session_id in active_sessions:
-            await self._end_collaboration_session(session_id, "Allstop command", broadcast_fn)
+            await self._end_collaboration_session(session_id, reason, broadcast_fn)
+        return len(active_sessions)
+    
+    async def handle_control(self, message: Dict[str, Any], broadcast_fn: Callable, notify_if_idle: bool = True) -> int:
+        """Apply a stop/allstop control message to the sessions this worker owns. Returns sessions stopped."""
+        action = message.get("action")
+        
+        if action == "stop":
+            session_id = message.get("session_id")
+            session = self.collaboration_sessions.get(session_id)
+            if not session or session.status != "active":
+                return 0
+            await self._end_collaboration_session(session_id, message.get("reason", "Stopped by user"), broadcast_fn)
+            return 1
+        
+        if action == "allstop":
+            reason = message.get("reason", "Allstop command")
+            return await self._handle_allstop_from_text(broadcast_fn, notify_if_idle, reason)
+        
+        logger.warning(f"Unknown control action: {action}")
+        return 0
     
     async def _end_collaboration_session(self, session_id: str, reason: str, broadcast_fn: Callable):
         """End a collaboration session."""
@@ -473,8 +784,9 @@ class Router:
             
         session = self.collaboration_sessions.get(session_id)
         if session:
-            session["status"] = "ended"
-            session["ended_at"] = time.time()
+            session.status = "ended"
+            session.state = "ended"
+            session.ended_at = time.time()
             logger.info(f"Session {session_id} marked as ended")
         else:
             logger.warning(f"Session {session_id} not found when trying to end it")
@@ -483,56 +795,82 @@ class Router:
         self.allstop_requests.add(session_id)
         logger.info(f"Added {session_id} to allstop requests")
         
+        # Abort the in-flight provider request, then the driver itself unless we are the driver
+        self._cancel_inflight(session_id)
+        driver = self.session_drivers.get(session_id)
+        if driver and not driver.done() and driver is not asyncio.current_task():
+            driver.cancel()
+        
+        # Everything the session already produced goes out before its end event
+        outbox = self.session_outboxes.pop(session_id, None)
+        if outbox:
+            await outbox.flush()
+        
         # Broadcast end event
         end_event = {
             "type": "collaboration_ended",
             "session_id": session_id,
+            "thread": session.thread if session else "default",
             "reason": reason,
             "ts": int(time.time())
         }
         await broadcast_fn(end_event)
         logger.info(f"Broadcasted collaboration_ended event for {session_id}")
         
-        # Clean up immediately and again after delay
-        await self._cleanup_session_immediate(session_id)
-        asyncio.create_task(self._cleanup_session_delayed(session_id))
+        # The reaper removes the session once ended_session_ttl has passed
+        self.ended_sessions.add(session_id)
     
-    async def _cleanup_session_immediate(self, session_id: str):
-        """Immediate cleanup of session data."""
-        if session_id in self.collaboration_sessions:
-            self.collaboration_sessions[session_id]["status"] = "ended"
-        
-        # Clean up call depth tracking
-        self.call_depth.pop(session_id, None)
-        
-    async def _cleanup_session_delayed(self, session_id: str):
-        """Clean up session data after a delay."""
-        await asyncio.sleep(3)  # Wait 3 seconds to ignore in-flight responses
-        self.allstop_requests.discard(session_id)
-        self.collaboration_sessions.pop(session_id, None)
-        self.call_depth.pop(session_id, None)  # Double cleanup
-        logger.info(f"Session {session_id} fully cleaned up")
+    def start_reaper(self):
+        if self.reaper_task is None:
+            self.reaper_task = asyncio.create_task(self._reaper())
+    
+    async def stop_reaper(self):
+        if self.reaper_task:
+            self.reaper_task.cancel()
+            await asyncio.gather(self.reaper_task, return_exceptions=True)
+            self.reaper_task = None
+    
+    async def _reaper(self):
+        """Sweep expired bookkeeping periodically (one task for the whole router)."""
+        while True:
+            await asyncio.sleep(self.reaper_interval)
+            try:
+                self.reap_expired()
+            except Exception as e:
+                logger.error(f"Reaper error: {e}")
+    
+    def reap_expired(self) -> int:
+        """Drop expired hop counts, allstop markers and ended sessions. Returns how many entries went."""
+        removed = len(self.hop_counts.reap()) + len(self.allstop_requests.reap())
+        for session_id in self.ended_sessions.reap():
+            session = self.collaboration_sessions.get(session_id)
+            # A session restarted under the same id is active again and stays
+            if session and not session.active:
+                del self.collaboration_sessions[session_id]
+                logger.info(f"Session {session_id} fully cleaned up")
+            removed += 1
+        return removed
+    
+    def bookkeeping_report(self) -> Dict[str, Any]:
+        """Sizes of the router's expiring maps for the health endpoint."""
+        return {
+            "hop_counts": self.hop_counts.stats(),
+            "allstop_requests": self.allstop_requests.stats(),
+            "ended_sessions": self.ended_sessions.stats(),
+            "sessions": len(self.collaboration_sessions),
+            "turn_reservations": {"open": len(self.turn_reservations), **self.reservation_stats}
+        }
     
     def _get_session_context(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get context for a collaboration session."""
         session = self.collaboration_sessions.get(session_id)
         if not session:
             return None
-        
-        # Get recent transcript (last 8 items to control token usage)
-        transcript = session["transcript"][-8:] if len(session["transcript"]) > 8 else session["transcript"]
-        
-        return {
-            "goal": session["goal"],
-            "round": session["round"],
-            "max_rounds": session.get("max_rounds"),
-            "mode": session["mode"],
-            "transcript": transcript
-        }
+        return session.context()
     
-    def _should_continue_collaboration(self, session: Dict[str, Any], handoff: Optional[Dict], final: bool) -> bool:
+    def _should_continue_collaboration(self, session: CollaborationSession, handoff: Optional[Dict], final: bool) -> bool:
         """Determine if collaboration should continue."""
-        mode = session["mode"]
+        mode = session.mode
         
         if mode == "collaborate":
             # Bounded mode: stop if final=true, no handoff, or max rounds reached
@@ -540,7 +878,7 @@ class Router:
                 return False
             if not handoff:
                 return False
-            if session["round"] >= session.get("max_rounds", 6):
+            if session.round >= (session.max_rounds or 6):
                 return False
             return True
         
@@ -551,19 +889,19 @@ class Router:
         
         return False
     
-    def _check_emergency_safeguards(self, session: Dict[str, Any]) -> Optional[str]:
+    def _check_emergency_safeguards(self, session: CollaborationSession) -> Optional[str]:
         """Check if emergency safeguards should trigger."""
         # Check turn limit
-        if session["round"] >= self.max_turns_emergency:
+        if session.round >= self.max_turns_emergency:
             return f"Emergency stop: {self.max_turns_emergency} turns reached"
         
         # Check time limit
-        elapsed_minutes = (time.time() - session["started_at"]) / 60
+        elapsed_minutes = (time.time() - session.started_at) / 60
         if elapsed_minutes >= self.max_elapsed_minutes:
             return f"Emergency stop: {self.max_elapsed_minutes} minutes elapsed"
         
         # Check token limit (approximate)
-        if session["total_tokens"] >= self.max_tokens_emergency:
+        if session.total_tokens >= self.max_tokens_emergency:
             return f"Emergency stop: {self.max_tokens_emergency} tokens reached"
         
         return None
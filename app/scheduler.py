@@ -0,0 +1,202 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is served first: interactive human calls jump ahead of background collaboration turns
+LANES = {"interactive": 0, "background": 1}
+
+class Reservation:
+    """A flow's next turn, reserved while its current turn runs; see TurnScheduler.reserve()."""
+
+    __slots__ = ("flow", "lane", "weight", "future", "closed")
+
+    def __init__(self, flow: str, lane: str, weight: float, future: asyncio.Future):
+        self.flow = flow
+        self.lane = lane
+        self.weight = weight
+        self.future = future
+        self.closed = False  # admitted to run() or given up; the scheduler no longer owes it anything
+
+class TurnScheduler:
+    """Global cap on concurrent agent turns with weighted fair queuing across sessions and priority lanes.
+
+    Within a lane, waiting turns are ordered by start-time fair queuing: each flow (a session or
+    thread) gets a virtual start tag from its previous finish tag (new flows start at the virtual
+    clock), and a turn advances its flow's finish tag by 1/weight. A flow with weight 2 therefore gets twice the turns
+    of a weight-1 flow while both are backlogged, and no flow can starve another in the same lane.
+    """
+
+    def __init__(self, max_concurrent: int = 8):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.virtual_time = 0.0
+        self.flow_finish: Dict[str, float] = {}
+        self.waiting: List[list] = []  # heap of [lane_rank, start_tag, seq, future, lane, enqueued_at]
+        self._seq = itertools.count()
+        self.running: Dict[str, int] = {}  # turns holding a slot, by flow
+        self.reserved: Dict[str, Reservation] = {}  # next turn per flow, queued when its running turn ends
+
+        # Metrics per lane
+        self.granted = {lane: 0 for lane in LANES}
+        self.queued_granted = {lane: 0 for lane in LANES}
+        self.total_wait_ms = {lane: 0.0 for lane in LANES}
+
+    async def acquire(self, flow: str, lane: str = "background", weight: float = 1.0):
+        """Wait for a turn slot."""
+        start_tag = self._start_tag(flow, lane, weight)
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            self.granted[lane] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(lane, start_tag, future)
+        await self._admitted(future)
+
+    def _start_tag(self, flow: str, lane: str, weight: float) -> float:
+        if lane not in LANES:
+            raise ValueError(f"Unknown scheduler lane: {lane}")
+        # A session re-queues its next turn only after the previous one finishes, by which time the
+        # clock has moved on; allowing one unit of lag keeps its weighted share instead of resetting it
+        start_tag = max(self.virtual_time - 1.0, self.flow_finish.get(flow, self.virtual_time))
+        self.flow_finish[flow] = start_tag + 1.0 / max(weight, 0.01)
+        return start_tag
+
+    def _enqueue(self, lane: str, start_tag: float, future: asyncio.Future):
+        heapq.heappush(self.waiting, [LANES[lane], start_tag, next(self._seq), future, lane, time.perf_counter()])
+
+    def _enqueue_reservation(self, reservation: Reservation):
+        # The start tag is taken only now, so a reservation given up before queuing costs its flow nothing
+        start_tag = self._start_tag(reservation.flow, reservation.lane, reservation.weight)
+        self._enqueue(reservation.lane, start_tag, reservation.future)
+
+    async def _admitted(self, future: asyncio.Future):
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: hand the slot on
+                self.release()
+            else:
+                future.cancel()  # leaves a tombstone that _grant_next skips
+            raise
+
+    def release(self, flow: Optional[str] = None):
+        """Return a slot and wake the next waiting turn. A flow's reserved next turn joins the queue first."""
+        if flow is not None:
+            self.running[flow] -= 1
+            if not self.running[flow]:
+                del self.running[flow]
+                reservation = self.reserved.pop(flow, None)
+                if reservation is not None and not reservation.future.done():
+                    self._enqueue_reservation(reservation)
+        self.active = max(0, self.active - 1)
+        self._grant_next()
+        self._prune_flows()
+
+    def _grant_next(self):
+        while self.active < self.max_concurrent and self.waiting:
+            _, start_tag, _, future, lane, enqueued_at = heapq.heappop(self.waiting)
+            if future.done():
+                continue
+            self.virtual_time = max(self.virtual_time, start_tag)
+            self.active += 1
+            self.granted[lane] += 1
+            self.queued_granted[lane] += 1
+            self.total_wait_ms[lane] += (time.perf_counter() - enqueued_at) * 1000
+            future.set_result(None)
+
+    def _prune_flows(self):
+        """Forget flows far enough behind the virtual clock that they would restart from it anyway."""
+        if len(self.flow_finish) <= self.max_concurrent * 4:
+            return
+        horizon = self.virtual_time - 1.0
+        self.flow_finish = {f: tag for f, tag in self.flow_finish.items() if tag > horizon}
+
+    @asynccontextmanager
+    async def turn(self, flow: str, lane: str = "background", weight: float = 1.0):
+        """Hold a turn slot for the duration of the block."""
+        await self.acquire(flow, lane, weight)
+        self.running[flow] = self.running.get(flow, 0) + 1
+        try:
+            yield
+        finally:
+            self.release(flow)
+
+    def reserve(self, flow: str, lane: str = "background", weight: float = 1.0) -> Reservation:
+        """Reserve the next turn of a flow while its current turn still runs; hand it to run() or cancel_reservation().
+
+        The reservation holds no slot. It joins the queue the moment the flow's running turn releases
+        its slot, so it is usually granted that very slot (unless an interactive call or a fairer flow
+        is waiting) without the caller having to ask again.
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown scheduler lane: {lane}")
+        reservation = Reservation(flow, lane, weight, asyncio.get_running_loop().create_future())
+        previous = self.reserved.pop(flow, None)
+        if previous is not None:
+            self.cancel_reservation(previous)
+        if flow in self.running:
+            self.reserved[flow] = reservation
+        else:
+            self._enqueue_reservation(reservation)
+            self._grant_next()
+        return reservation
+
+    def cancel_reservation(self, reservation: Reservation):
+        """Give up a reserved turn, returning its slot if it had already been granted. Safe to call more than once."""
+        if reservation.closed:
+            return
+        reservation.closed = True
+        if self.reserved.get(reservation.flow) is reservation:
+            del self.reserved[reservation.flow]
+        if not reservation.future.done():
+            reservation.future.cancel()  # a tombstone if it was queued
+        elif not reservation.future.cancelled():
+            self.release()
+
+    async def run(self, flow: str, call: Callable[[], Awaitable[Any]], lane: str = "background", weight: float = 1.0,
+                  reservation: Optional[Reservation] = None) -> Any:
+        """Run call() once a slot is granted (or the reservation comes through); the coroutine is only created after admission."""
+        if reservation is None:
+            async with self.turn(flow, lane, weight):
+                return await call()
+        try:
+            if self.reserved.get(flow) is reservation and flow not in self.running:
+                # Nothing of this flow is running any more: queue now
+                del self.reserved[flow]
+                self._enqueue_reservation(reservation)
+                self._grant_next()
+            await reservation.future
+        except BaseException:
+            self.cancel_reservation(reservation)  # hands on a slot granted just as we were cancelled
+            raise
+        reservation.closed = True
+        self.running[flow] = self.running.get(flow, 0) + 1
+        try:
+            return await call()
+        finally:
+            self.release(flow)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {lane: 0 for lane in LANES}
+        for entry in self.waiting:
+            if not entry[3].done():
+                queued[entry[4]] += 1
+        return {
+            "max_concurrent_turns": self.max_concurrent,
+            "active_turns": self.active,
+            "reserved_turns": len(self.reserved),
+            "queued": queued,
+            "granted": dict(self.granted),
+            "avg_queue_wait_ms": {
+                lane: round(self.total_wait_ms[lane] / self.queued_granted[lane], 1) if self.queued_granted[lane] else 0.0
+                for lane in LANES
+            }
+        }
@@ -1,13 +1,14 @@
 import os
-import json
 import asyncio
 import logging
 import time
-from typing import Set, Dict, Any
+import uuid
+from typing import Any, Dict, List
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
+import msgspec
 
 # Load environment variables first
 load_dotenv()
@@ -19,6 +20,11 @@ logger = logging.getLogger(__name__)
 # Now import our modules after environment is loaded
 from .settings_manager import SettingsManager
 from .router import Router
+from .dispatcher import EventDispatcher
+from .connections import ConnectionManager
+from .event_bus import CONTROL_CHANNEL, EVENTS_CHANNEL, create_event_bus
+from .static_assets import StaticAssetCache
+from .protocol import ENCODINGS, decode_client_message
 
 app = FastAPI()
 
@@ -28,96 +34,119 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 # Initialize components
 settings_manager = SettingsManager()
 router = Router(settings_manager)
+dispatcher = EventDispatcher()
 
-# Global state
-active_connections: Set[WebSocket] = set()
+# Global connection manager
+manager = ConnectionManager(
+    max_queue=settings_manager.get("ws_send_queue_size"),
+    overflow_policy=settings_manager.get("ws_overflow_policy"),
+    replay_size=settings_manager.get("replay_buffer_size"),
+    replay_max_topics=settings_manager.get("replay_max_topics"),
+    max_observers=settings_manager.get("sse_max_observers"),
+    max_connections=settings_manager.get("ws_max_connections"),
+    ping_interval=settings_manager.get("ws_ping_interval"),
+    idle_timeout=settings_manager.get("ws_idle_timeout")
+)
 
-class ConnectionManager:
-    """Manages WebSocket connections and broadcasting."""
-    
-    def __init__(self):
-        self.active_connections: Set[WebSocket] = set()
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.add(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.discard(websocket)
-    
-    async def broadcast(self, message: Dict[str, Any]):
-        """Broadcast a message to all connected clients."""
-        if not self.active_connections:
-            return
-        
-        message_json = json.dumps(message)
-        disconnected = set()
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                logger.error(f"Failed to send message to client: {e}")
-                disconnected.add(connection)
-        
-        # Remove disconnected clients
-        for conn in disconnected:
-            self.active_connections.discard(conn)
+# Event bus: carries room events and stop/allstop between workers
+event_bus = create_event_bus(settings_manager)
 
-# Global connection manager
-manager = ConnectionManager()
+async def broadcast(message: Dict[str, Any]):
+    """Publish a room event; every worker (including this one) fans it out to its own clients."""
+    await event_bus.publish(EVENTS_CHANNEL, message)
+
+async def publish_control(message: Dict[str, Any]):
+    """Send a stop/allstop request to whichever worker owns the affected sessions."""
+    await event_bus.publish(CONTROL_CHANNEL, {**message, "origin": event_bus.worker_id})
+
+async def handle_control(message: Dict[str, Any]):
+    # Only the worker that received the request reports "nothing to stop", and only when it sees every session
+    notify_if_idle = message.get("origin") == event_bus.worker_id and not event_bus.distributed
+    await router.handle_control(message, broadcast, notify_if_idle=notify_if_idle)
+
+event_bus.on(EVENTS_CHANNEL, manager.broadcast)
+event_bus.on(CONTROL_CHANNEL, handle_control)
+
+# HTML pages are compressed once at startup and revalidated by content hash
+static_assets = StaticAssetCache("app/static", max_age=settings_manager.get("static_max_age"))
+static_assets.load("index.html")
+static_assets.load("settings.html")
 
 @app.get("/")
-async def serve_index():
+async def serve_index(request: Request):
     """Serve the main page."""
-    return FileResponse("app/static/index.html")
+    return static_assets.response("index.html", request)
 
 @app.get("/settings")
-async def serve_settings():
+async def serve_settings(request: Request):
     """Serve the settings page."""
-    return FileResponse("app/static/settings.html")
+    return static_assets.response("settings.html", request)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time communication."""
-    await manager.connect(websocket)
-    logger.info("Client connected")
+    client = await manager.connect(websocket)
+    if client is None:
+        return
+    logger.info(f"Client connected ({client.client_id})")
+    
+    # Clients may ask for MessagePack binary frames with ?encoding=msgpack or a hello message
+    if websocket.query_params.get("encoding") in ENCODINGS:
+        client.encoding = websocket.query_params["encoding"]
     
     try:
         while True:
-            # Receive message from client
-            data = await websocket.receive_text()
+            # Receive message from client (text JSON, or binary MessagePack)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            client.touch()
             
+            data = frame.get("bytes") if frame.get("bytes") is not None else frame.get("text")
             try:
-                message = json.loads(data)
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received: {data}")
+                message = decode_client_message(data, "msgpack" if isinstance(data, bytes) else "json")
+            except (msgspec.DecodeError, msgspec.ValidationError) as e:
+                logger.error(f"Invalid message received: {e}")
+                manager.send_to(client, {"type": "error", "text": f"Invalid message: {e}", "ts": int(time.time())})
                 continue
                 
-            logger.info(f"Received message: {message}")
-            
             # Handle different message types
-            message_type = message.get("type")
+            message_type = message["type"]
+            if message_type == "pong":
+                continue
+            
+            if message_type == "hello":
+                client.encoding = message["encoding"]
+                manager.send_to(client, {"type": "hello", "encoding": client.encoding, "server_seq": manager.seq, "ts": int(time.time())})
+                continue
+            
+            logger.info(f"Received message: {message}")
             
             if message_type == "human_message":
                 # Create event with timestamp and broadcast immediately
                 event = {
                     "type": "human_message",
                     "sender": "you",
-                    "target": message.get("target", "router"),
-                    "thread": message.get("thread", "default"),
-                    "text": message.get("text", ""),
+                    "target": message["target"],
+                    "thread": message["thread"],
+                    "text": message["text"],
                     "ts": int(time.time()),
-                    "call_id": f"msg_{int(time.time())}"
+                    "call_id": f"msg_{uuid.uuid4().hex}",
+                    "judge": message.get("judge")
                 }
                 
-                await manager.broadcast(event)
-                await router.process_event(event, manager.broadcast)
+                await broadcast(event)
+                
+                if router._is_allstop_command(event["text"]):
+                    # Control message: handle inline so it is never queued behind a running session
+                    await publish_control({"action": "allstop", "reason": "Allstop command"})
+                else:
+                    dispatcher.submit(router.process_event(event, broadcast), key=event["thread"])
                 
             elif message_type == "start_collaboration":
-                # Handle collaboration start
+                # Run the whole session in the background so this socket keeps reading
                 logger.info(f"Starting collaboration: {message}")
-                await router.process_event(message, manager.broadcast)
+                dispatcher.submit(router.process_event(message, broadcast), key=message["session_id"])
                 
             elif message_type == "stop_collaboration":
                 # Handle collaboration stop with immediate acknowledgment
@@ -125,7 +154,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 logger.info(f"Stopping collaboration for session: {session_id}")
                 
                 if session_id:
-                    await router.process_event(message, manager.broadcast)
+                    await publish_control({"action": "stop", "session_id": session_id, "reason": "Stopped by user"})
                     
                     # Send immediate confirmation
                     stop_confirm = {
@@ -134,20 +163,30 @@ async def websocket_endpoint(websocket: WebSocket):
                         "reason": "Stopped by user",
                         "ts": int(time.time())
                     }
-                    await manager.broadcast(stop_confirm)
+                    await broadcast(stop_confirm)
                 else:
                     logger.warning("Stop collaboration message missing session_id")
                 
-            else:
-                # Unknown message type
-                logger.warning(f"Unknown message type: {message_type}")
-                error_event = {
-                    "type": "error",
-                    "text": f"Unknown message type: {message_type}",
+            elif message_type in ("subscribe", "unsubscribe"):
+                # Topic subscriptions, e.g. "thread:default" or "session:<id>"
+                topics = message["topics"]
+                replayed = 0
+                if message_type == "subscribe":
+                    current = manager.subscribe(client, topics)
+                    # Reconnecting clients pass the last seq they saw to get only what they missed
+                    resume_from = message["resume_from"]
+                    if resume_from is not None and resume_from >= 0:
+                        replayed = manager.replay(client, resume_from)
+                else:
+                    current = manager.unsubscribe(client, topics)
+                manager.send_to(client, {
+                    "type": "subscribed",
+                    "topics": current,
+                    "server_seq": manager.seq,
+                    "replayed": replayed,
                     "ts": int(time.time())
-                }
-                await manager.broadcast(error_event)
-                
+                })
+
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         logger.info("Client disconnected")
@@ -155,15 +194,92 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(websocket)
 
+def _event_stream(request: Request, topics: List[str]):
+    """Stream events for the given topics as Server-Sent Events, resuming after Last-Event-ID."""
+    observer = manager.add_observer(topics)
+    if observer is None:
+        raise HTTPException(status_code=503, detail="Too many observers")
+
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    if last_event_id and last_event_id.isdigit():
+        manager.replay(observer, int(last_event_id))
+
+    keepalive = settings_manager.get("sse_keepalive_seconds")
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not observer.closed:
+                if not observer.queue:
+                    observer.ready.clear()
+                    try:
+                        await asyncio.wait_for(observer.ready.wait(), timeout=keepalive)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                    continue
+                # Everything queued since the last write goes out as one chunk
+                yield observer.drain()
+        finally:
+            manager.remove_observer(observer)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events")
+async def stream_events(request: Request, topics: str = "*"):
+    """Read-only SSE stream for passive observers, e.g. /events?topics=thread:default,session:abc"""
+    return _event_stream(request, [t.strip() for t in topics.split(",") if t.strip()])
+
+@app.get("/api/sessions/{session_id}/events")
+async def stream_session_events(session_id: str, request: Request):
+    """Read-only SSE stream of one collaboration session."""
+    return _event_stream(request, [f"session:{session_id}"])
+
+@app.on_event("startup")
+async def start_event_bus():
+    """Connect the event bus before accepting traffic."""
+    await event_bus.start()
+    manager.start_heartbeat()
+    router.start_reaper()
+    # Open provider connections in the background so the first user request does not pay for TCP/TLS setup
+    router.http_pools.start_warm_up()
+
+@app.on_event("shutdown")
+async def shutdown_background_work():
+    """Cancel router work still running in the background."""
+    await dispatcher.shutdown()
+    await manager.stop_heartbeat()
+    await router.stop_reaper()
+    await router.http_pools.close()
+    if router.response_cache:
+        router.response_cache.close()
+    await event_bus.stop()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {
         "status": "healthy", 
         "active_connections": len(manager.active_connections),
+        "background_tasks": dispatcher.pending(),
+        "client_queues": manager.stats(),
+        "event_bus": event_bus.stats(),
+        "static_assets": static_assets.stats(),
+        "cancellations": router.cancellation_report(),
+        "scheduler": router.scheduler.stats(),
+        "bookkeeping": router.bookkeeping_report(),
+        "usage": router.usage.snapshot(),
+        "latency": router.latency.snapshot(),
+        "rate_limits": {endpoint: limiter.snapshot() for endpoint, limiter in router.rate_limiters.items()},
+        "circuit_breakers": {endpoint: layer.snapshot() for endpoint, layer in router.resilience.items()},
+        "http_pools": router.http_pools.stats(),
+        "response_cache": router.response_cache.stats() if router.response_cache else None,
         "active_collaborations": len([
             s for s in router.collaboration_sessions.values() 
-            if s.get("status") == "active"
+            if s.active
         ]),
         "openai_key_configured": bool(settings_manager.get("openai_api_key")),
         "anthropic_key_configured": bool(settings_manager.get("anthropic_api_key"))
@@ -192,20 +308,28 @@ async def update_settings(request: Request):
     logger.info("Settings updated")
     return {"status": "success", "message": "Settings updated"}
 
+@app.get("/api/agents")
+async def get_agents():
+    """List configured agents and the handoff routing between them."""
+    routing = router.routing.describe()
+    return [
+        {
+            "name": spec.name,
+            "display_name": spec.display_name,
+            "provider": spec.provider,
+            "model": spec.model,
+            **routing[spec.name]
+        }
+        for spec in router.agents
+    ]
+
 @app.get("/api/sessions")
 async def get_active_sessions():
     """Get information about active collaboration sessions."""
     sessions = {}
     for session_id, session in router.collaboration_sessions.items():
-        if session.get("status") == "active":
-            sessions[session_id] = {
-                "goal": session["goal"],
-                "mode": session["mode"],
-                "round": session["round"],
-                "max_rounds": session.get("max_rounds"),
-                "current_speaker": session.get("current_speaker"),
-                "started_at": session["started_at"]
-            }
+        if session.active:
+            sessions[session_id] = session.summary()
     return sessions
 
 @app.post("/api/stop")
@@ -215,23 +339,23 @@ async def stop_all_sessions():
         # Find all active sessions
         active_sessions = [
             session_id for session_id, session in router.collaboration_sessions.items()
-            if session.get("status") == "active"
+            if session.active
         ]
         
-        if not active_sessions:
+        if not active_sessions and not event_bus.distributed:
             return {"success": False, "message": "No active sessions to stop", "stopped_sessions": []}
         
-        # Stop all active sessions
-        stopped_sessions = []
-        for session_id in active_sessions:
-            logger.info(f"Stopping session {session_id} via REST API")
-            await router._end_collaboration_session(session_id, "Stopped via REST API", manager.broadcast)
-            stopped_sessions.append(session_id)
+        # Stop all active sessions (on every worker when the bus is shared)
+        logger.info(f"Stopping sessions via REST API: {active_sessions}")
+        await publish_control({"action": "allstop", "reason": "Stopped via REST API"})
         
+        message = f"Stopped {len(active_sessions)} session(s)"
+        if event_bus.distributed:
+            message += " on this worker; stop sent to all workers"
         return {
             "success": True, 
-            "message": f"Stopped {len(stopped_sessions)} session(s)",
-            "stopped_sessions": stopped_sessions
+            "message": message,
+            "stopped_sessions": active_sessions
         }
         
     except Exception as e:
@@ -241,8 +365,9 @@ async def stop_all_sessions():
 @app.post("/api/sessions/{session_id}/stop")
 async def stop_session(session_id: str):
     """Stop a specific collaboration session."""
-    if session_id in router.collaboration_sessions:
-        await router._end_collaboration_session(session_id, "Stopped via API", manager.broadcast)
+    if session_id in router.collaboration_sessions or event_bus.distributed:
+        # The owning worker (possibly another process) ends the session
+        await publish_control({"action": "stop", "session_id": session_id, "reason": "Stopped via API"})
         return {"status": "success", "message": f"Session {session_id} stopped"}
     else:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -252,13 +377,7 @@ async def debug_sessions():
     """Debug endpoint to view active sessions."""
     return {
         "collaboration_sessions": {
-            session_id: {
-                "status": session.get("status"),
-                "goal": session.get("goal"),
-                "round": session.get("round"),
-                "mode": session.get("mode"),
-                "started_at": session.get("started_at")
-            }
+            session_id: {"status": session.status, **session.summary()}
             for session_id, session in router.collaboration_sessions.items()
         },
         "allstop_requests": list(router.allstop_requests)
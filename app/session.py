@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from .connectors.base import UsageLedger
+
+logger = logging.getLogger(__name__)
+
+class Turn:
+    """One transcript entry."""
+
+    __slots__ = ("sender", "message", "round", "ts")
+
+    def __init__(self, sender: str, message: str, round: int, ts: int):
+        self.sender = sender
+        self.message = message
+        self.round = round
+        self.ts = ts
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"sender": self.sender, "message": self.message, "round": self.round, "ts": self.ts}
+
+class TranscriptSpill:
+    """Appends turns that fall out of a session's context window to one JSONL file per session."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.spilled = 0
+
+    def _path(self, session_id: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id)
+        return os.path.join(self.directory, f"{safe}.jsonl")
+
+    def append(self, session_id: str, turn: Turn):
+        try:
+            with open(self._path(session_id), "a") as f:
+                f.write(json.dumps(turn.to_dict()) + "\n")
+            self.spilled += 1
+        except OSError as e:
+            logger.error(f"Could not spill transcript turn for session {session_id}: {e}")
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        """Older turns of a session, oldest first."""
+        try:
+            with open(self._path(session_id)) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+class CollaborationSession:
+    """State of one collaboration. The transcript is a bounded context window; older turns go to the spill, if any."""
+
+    __slots__ = (
+        "id", "thread", "goal", "mode", "initial_speaker", "current_speaker", "max_rounds", "round",
+        "status", "state", "started_at", "ended_at", "transcript", "turn_count", "total_tokens", "usage", "spill"
+    )
+
+    def __init__(self, session_id: str, thread: str, goal: str, mode: str, initial_speaker: str,
+                 max_rounds: Optional[int], context_window: int, usage: UsageLedger,
+                 spill: Optional[TranscriptSpill] = None):
+        self.id = session_id
+        self.thread = thread
+        self.goal = goal
+        self.mode = mode
+        self.initial_speaker = initial_speaker
+        self.current_speaker = initial_speaker
+        self.max_rounds = max_rounds
+        self.round = 1
+        self.status = "active"
+        self.state = "starting"
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.transcript: Deque[Turn] = deque(maxlen=context_window)
+        self.turn_count = 0
+        self.total_tokens = 0
+        self.usage = usage
+        self.spill = spill
+
+    def add_turn(self, sender: str, message: str):
+        if self.spill is not None and len(self.transcript) == self.transcript.maxlen:
+            self.spill.append(self.id, self.transcript[0])
+        self.transcript.append(Turn(sender, message, self.round, int(time.time())))
+        self.turn_count += 1
+
+    @property
+    def active(self) -> bool:
+        return self.status == "active"
+
+    def context(self) -> Dict[str, Any]:
+        """What a connector needs for the next turn; the transcript is the live window, not a copy."""
+        return {
+            "goal": self.goal,
+            "round": self.round,
+            "max_rounds": self.max_rounds,
+            "mode": self.mode,
+            "transcript": self.transcript
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "goal": self.goal,
+            "mode": self.mode,
+            "round": self.round,
+            "max_rounds": self.max_rounds,
+            "current_speaker": self.current_speaker,
+            "state": self.state,
+            "started_at": self.started_at,
+            "turns": self.turn_count,
+            "total_tokens": self.total_tokens,
+            "usage": self.usage.snapshot()
+        }
@@ -1,4 +1,5 @@
 import os
+import json
 from typing import Dict, Any
 from pydantic import BaseModel
 
@@ -15,7 +16,57 @@ class SettingsManager:
             "anthropic_api_key": os.getenv("ANTHROPIC_API_KEY"),
             "port": int(os.getenv("PORT", "8000")),
             "bind_host": os.getenv("BIND_HOST", "127.0.0.1"),
-            "log_level": os.getenv("LOG_LEVEL", "INFO")
+            "log_level": os.getenv("LOG_LEVEL", "INFO"),
+            "ws_send_queue_size": int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+            "ws_overflow_policy": os.getenv("WS_OVERFLOW_POLICY", "drop_oldest"),
+            "replay_buffer_size": int(os.getenv("REPLAY_BUFFER_SIZE", "500")),
+            "replay_max_topics": int(os.getenv("REPLAY_MAX_TOPICS", "1000")),
+            "sse_max_observers": int(os.getenv("SSE_MAX_OBSERVERS", "5000")),
+            "sse_keepalive_seconds": float(os.getenv("SSE_KEEPALIVE_SECONDS", "15")),
+            "event_bus": os.getenv("EVENT_BUS", "memory"),
+            "redis_url": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+            "event_bus_prefix": os.getenv("EVENT_BUS_PREFIX", "teamai"),
+            "static_max_age": int(os.getenv("STATIC_MAX_AGE", "0")),
+            "ws_max_connections": int(os.getenv("WS_MAX_CONNECTIONS", "1000")),
+            "ws_ping_interval": float(os.getenv("WS_PING_INTERVAL", "20")),
+            "ws_idle_timeout": float(os.getenv("WS_IDLE_TIMEOUT", "60")),
+            "max_concurrent_turns": int(os.getenv("MAX_CONCURRENT_TURNS", "8")),
+            "scheduler_weight_collaborate": float(os.getenv("SCHEDULER_WEIGHT_COLLABORATE", "2")),
+            "scheduler_weight_autopilot": float(os.getenv("SCHEDULER_WEIGHT_AUTOPILOT", "1")),
+            "openai_rpm": int(os.getenv("OPENAI_RPM", "0")),
+            "openai_tpm": int(os.getenv("OPENAI_TPM", "0")),
+            "anthropic_rpm": int(os.getenv("ANTHROPIC_RPM", "0")),
+            "anthropic_tpm": int(os.getenv("ANTHROPIC_TPM", "0")),
+            "model_prices": json.loads(os.getenv("MODEL_PRICES", "{}")),
+            "panel_judge": os.getenv("PANEL_JUDGE", ""),
+            "agents_config": os.getenv("AGENTS_CONFIG", ""),
+            "session_context_window": int(os.getenv("SESSION_CONTEXT_WINDOW", "8")),
+            "transcript_spill_dir": os.getenv("TRANSCRIPT_SPILL_DIR", ""),
+            "hop_count_ttl": float(os.getenv("HOP_COUNT_TTL", "600")),
+            "ended_session_ttl": float(os.getenv("ENDED_SESSION_TTL", "3")),
+            "reaper_interval": float(os.getenv("REAPER_INTERVAL", "1")),
+            "stream_responses": os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes"),
+            "delta_flush_interval": float(os.getenv("DELTA_FLUSH_INTERVAL", "0.05")),
+            "retry_max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+            "retry_base_delay": float(os.getenv("RETRY_BASE_DELAY", "0.5")),
+            "retry_max_delay": float(os.getenv("RETRY_MAX_DELAY", "8")),
+            "call_deadline": float(os.getenv("CALL_DEADLINE", "90")),
+            "breaker_failure_threshold": int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+            "breaker_cooldown": float(os.getenv("BREAKER_COOLDOWN", "30")),
+            "http_pooling": os.getenv("HTTP_POOLING", "true").lower() in ("1", "true", "yes"),
+            "http_max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+            "http_max_keepalive": int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+            "http_keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120")),
+            "http_connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+            "http_read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+            "http2": os.getenv("HTTP2", "false").lower() in ("1", "true", "yes"),
+            "http_warmup_connections": int(os.getenv("HTTP_WARMUP_CONNECTIONS", "2")),
+            "prompt_caching": os.getenv("PROMPT_CACHING", "true").lower() in ("1", "true", "yes"),
+            "response_cache": os.getenv("RESPONSE_CACHE", "false").lower() in ("1", "true", "yes"),
+            "response_cache_size": int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            "response_cache_ttl": float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            "response_cache_path": os.getenv("RESPONSE_CACHE_PATH", ""),
+            "response_cache_force": os.getenv("RESPONSE_CACHE_FORCE", "false").lower() in ("1", "true", "yes")
         }
     
     def get(self, key: str, default=None):
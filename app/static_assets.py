@@ -0,0 +1,125 @@
+import os
+import gzip
+import hashlib
+import logging
+from typing import Any, Dict, Tuple
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+class PrecompressedAsset:
+    """A static file read once and kept in identity, gzip and (optionally) brotli form."""
+
+    def __init__(self, path: str, media_type: str):
+        with open(path, "rb") as f:
+            body = f.read()
+
+        self.path = path
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()[:20]
+
+        # encoding -> (bytes, strong ETag); each encoding is a different representation
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (body, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def sizes(self) -> Dict[str, int]:
+        return {encoding: len(body) for encoding, (body, _) in self.variants.items()}
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into {encoding: q}."""
+    accepted = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+class StaticAssetCache:
+    """Serves pre-compressed static pages with content-hash ETags and 304 revalidation."""
+
+    def __init__(self, directory: str, max_age: int = 0):
+        self.directory = directory
+        self.max_age = max_age
+        self.assets: Dict[str, PrecompressedAsset] = {}
+        self.not_modified = 0
+        self.served = 0
+
+    def load(self, name: str, media_type: str = "text/html; charset=utf-8") -> PrecompressedAsset:
+        asset = PrecompressedAsset(os.path.join(self.directory, name), media_type)
+        self.assets[name] = asset
+        logger.info(f"Precompressed {name}: {asset.sizes()}")
+        return asset
+
+    def _choose_encoding(self, asset: PrecompressedAsset, accept_encoding: str) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return "identity"
+
+    def _cache_control(self) -> str:
+        if self.max_age > 0:
+            return f"public, max-age={self.max_age}"
+        # Stable URLs: always revalidate, which costs a near-empty 304 when unchanged
+        return "no-cache"
+
+    def response(self, name: str, request: Request) -> Response:
+        """Build the response for a page, answering 304 when the client already has it."""
+        asset = self.assets[name]
+        encoding = self._choose_encoding(asset, request.headers.get("accept-encoding", ""))
+        body, etag = asset.variants[encoding]
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self._cache_control(),
+            "Vary": "Accept-Encoding"
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self._matches(asset, if_none_match):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        self.served += 1
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+    @staticmethod
+    def _matches(asset: PrecompressedAsset, if_none_match: str) -> bool:
+        """Any representation's tag means the client has this content (weak comparison, per RFC 9110)."""
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag in asset.etags:
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "brotli": brotli is not None,
+            "served": self.served,
+            "not_modified": self.not_modified,
+            "assets": {name: asset.sizes() for name, asset in self.assets.items()}
+        }
@@ -4,4 +4,83 @@ ANTHROPIC_API_KEY=KEY_HERE
 
 # Server Configuration
 PORT=8000
-BIND_HOST=127.0.0.1
\ No newline at end of file
+BIND_HOST=127.0.0.1
+
+# WebSocket fan-out (optional)
+WS_SEND_QUEUE_SIZE=256
+WS_OVERFLOW_POLICY=drop_oldest
+WS_MAX_CONNECTIONS=1000
+WS_PING_INTERVAL=20
+WS_IDLE_TIMEOUT=60
+REPLAY_BUFFER_SIZE=500
+REPLAY_MAX_TOPICS=1000
+SSE_MAX_OBSERVERS=5000
+SSE_KEEPALIVE_SECONDS=15
+
+# Cross-worker event bus (optional; use redis with uvicorn --workers N)
+EVENT_BUS=memory
+REDIS_URL=redis://127.0.0.1:6379/0
+EVENT_BUS_PREFIX=teamai
+
+# Static pages (optional)
+STATIC_MAX_AGE=0
+
+# Turn scheduling (optional)
+MAX_CONCURRENT_TURNS=8
+SCHEDULER_WEIGHT_COLLABORATE=2
+SCHEDULER_WEIGHT_AUTOPILOT=1
+
+# Provider rate limits (optional; 0 = learn from response headers)
+OPENAI_RPM=0
+OPENAI_TPM=0
+ANTHROPIC_RPM=0
+ANTHROPIC_TPM=0
+
+# Token accounting (optional; USD per million tokens)
+MODEL_PRICES='{}'
+
+# Panel mode (optional; gpt or claude merges @panel answers)
+PANEL_JUDGE=
+
+# Agent team (optional; JSON list or path to a JSON file, see readme)
+AGENTS_CONFIG=
+
+# Session memory (optional)
+SESSION_CONTEXT_WINDOW=8
+TRANSCRIPT_SPILL_DIR=
+
+# Router bookkeeping expiry (optional; seconds)
+ENDED_SESSION_TTL=3
+HOP_COUNT_TTL=600
+REAPER_INTERVAL=1
+
+# Streaming replies (optional)
+STREAM_RESPONSES=true
+DELTA_FLUSH_INTERVAL=0.05
+
+# Retries and circuit breaker (optional)
+RETRY_MAX_ATTEMPTS=3
+RETRY_BASE_DELAY=0.5
+RETRY_MAX_DELAY=8
+CALL_DEADLINE=90
+BREAKER_FAILURE_THRESHOLD=5
+BREAKER_COOLDOWN=30
+
+# Provider connection pools (optional)
+HTTP_MAX_CONNECTIONS=20
+HTTP_MAX_KEEPALIVE=10
+HTTP_KEEPALIVE_EXPIRY=120
+HTTP_CONNECT_TIMEOUT=5
+HTTP_READ_TIMEOUT=60
+HTTP2=false
+HTTP_WARMUP_CONNECTIONS=2
+
+# Anthropic prompt caching (optional)
+PROMPT_CACHING=true
+
+# Single-mode response cache (optional)
+RESPONSE_CACHE=false
+RESPONSE_CACHE_SIZE=1000
+RESPONSE_CACHE_TTL=3600
+RESPONSE_CACHE_PATH=
+RESPONSE_CACHE_FORCE=false
@@ -0,0 +1,55 @@
+import json
+
+from app.connectors.envelope import EnvelopeParser
+
+def _parse(reply: str, chunk_size: int = 1):
+    """Feed a reply in fixed-size chunks; returns the parser and what its callbacks saw."""
+    seen = {"message": [], "handoff": []}
+    parser = EnvelopeParser(
+        on_message=seen["message"].append,
+        on_handoff=lambda to: seen["handoff"].append((to, parser.length))
+    )
+    for start in range(0, len(reply), chunk_size):
+        parser.feed(reply[start:start + chunk_size])
+    return parser, seen
+
+def test_streams_the_message_and_returns_the_envelope():
+    reply = json.dumps({"message": "Hi Bob, over to you.", "handoff": {"to": "bob", "task": "review"}, "final": False})
+    for chunk_size in (1, 3, len(reply)):
+        parser, seen = _parse(reply, chunk_size)
+        assert "".join(seen["message"]) == "Hi Bob, over to you."
+        assert parser.envelope() == json.loads(reply)
+        assert not parser.recovered
+
+def test_handoff_is_reported_before_the_reply_ends():
+    reply = '{"handoff": {"to": "carol"}, "message": "a long answer that keeps going"}'
+    parser, seen = _parse(reply)
+    assert [to for to, _ in seen["handoff"]] == ["carol"]
+    assert seen["handoff"][0][1] < len(reply) // 2
+
+def test_escapes_and_surrogate_pairs_are_decoded():
+    reply = '{"message": "line\\nquote \\" tab\\t \\u00e9 \\ud83d\\ude00"}'
+    parser, seen = _parse(reply)
+    assert "".join(seen["message"]) == 'line\nquote " tab\t é 😀'
+    assert parser.envelope()["message"] == 'line\nquote " tab\t é 😀'
+
+def test_fenced_json_is_still_an_envelope():
+    parser, seen = _parse('```json\n{"message": "fenced", "final": true}\n```')
+    assert "".join(seen["message"]) == "fenced"
+    assert parser.envelope() == {"message": "fenced", "final": True}
+
+def test_plain_text_reply_is_streamed_as_is():
+    parser, seen = _parse("  Just words, no JSON.")
+    assert "".join(seen["message"]) == "Just words, no JSON."
+    assert parser.envelope() == {"message": "Just words, no JSON.", "final": False}
+
+def test_truncated_reply_keeps_message_and_handoff():
+    parser, _ = _parse('{"message": "cut short", "handoff": {"to": "bob", "task": "fini')
+    envelope = parser.envelope()
+    assert parser.recovered
+    assert envelope == {"message": "cut short", "final": False, "handoff": {"to": "bob"}}
+
+def test_nested_message_keys_are_not_the_message():
+    parser, seen = _parse('{"handoff": {"to": "bob", "message": "not this"}, "message": "this"}')
+    assert "".join(seen["message"]) == "this"
+    assert parser.envelope()["message"] == "this"
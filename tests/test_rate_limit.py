@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from app.connectors.rate_limit import RateLimiter, TokenBucket, estimate_tokens, parse_rate_limit_headers
+
+def test_bucket_refills_continuously():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.delay(1, now) == pytest.approx(1.0)
+    assert bucket.delay(1, now + 1.0) == 0.0
+
+def test_oversized_request_waits_only_for_a_full_bucket():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.delay(1000, now) == pytest.approx(60.0)
+
+def test_zero_capacity_is_unlimited():
+    bucket = TokenBucket(0)
+    bucket.take(10 ** 9)
+    assert bucket.delay(10 ** 9, time.monotonic()) == 0.0
+    assert bucket.snapshot()["available"] is None
+
+def test_refund_never_overfills():
+    bucket = TokenBucket(100)
+    bucket.take(30)
+    bucket.refund(50)
+    assert bucket.level == 100
+    bucket.refund(-10)
+    assert bucket.level == 100
+
+def test_provider_headers_cap_the_bucket():
+    bucket = TokenBucket(0)
+    bucket.observe(limit=500, remaining=None)
+    assert bucket.capacity == 500
+    bucket.observe(limit=500, remaining=20)
+    assert bucket.level == pytest.approx(20, abs=1)
+
+def test_settle_refunds_and_charges_the_difference():
+    async def main():
+        limiter = RateLimiter("test", tpm=60000)
+        reserved = await limiter.acquire(1000)
+        assert reserved == 1000
+        assert limiter.tokens.level == pytest.approx(59000, abs=5)
+
+        limiter.settle(reserved, 200)
+        assert limiter.tokens.level == pytest.approx(59800, abs=5)
+        limiter.settle(200, 700)
+        assert limiter.tokens.level == pytest.approx(59300, abs=5)
+
+    asyncio.run(main())
+
+def test_rpm_budget_makes_callers_wait():
+    async def main():
+        limiter = RateLimiter("test", rpm=600)  # one request every 0.1s
+        limiter.requests.level = 1.0
+        await limiter.acquire(1)
+        started = time.monotonic()
+        await limiter.acquire(1)
+        assert time.monotonic() - started >= 0.08
+        assert limiter.snapshot()["waited"] == 1
+
+    asyncio.run(main())
+
+def test_rate_limited_response_pauses_callers():
+    async def main():
+        limiter = RateLimiter("test")
+        limiter.on_rate_limited({"retry-after": "0.2"})
+        assert limiter.rate_limited == 1
+        started = time.monotonic()
+        await limiter.acquire(1)
+        assert time.monotonic() - started >= 0.15
+
+    asyncio.run(main())
+
+def test_reset_duration_headers_set_the_pause():
+    limiter = RateLimiter("test")
+    limiter.on_rate_limited({"x-ratelimit-reset-requests": "1m30s"})
+    assert limiter.blocked_until - time.monotonic() == pytest.approx(90, abs=1)
+
+def test_parse_headers_of_either_provider():
+    assert parse_rate_limit_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-tokens": "1234"
+    }) == {"limit_requests": 500, "remaining_requests": None, "limit_tokens": None, "remaining_tokens": 1234}
+    assert parse_rate_limit_headers({"anthropic-ratelimit-tokens-limit": "80000"})["limit_tokens"] == 80000
+    assert parse_rate_limit_headers({"x-ratelimit-limit-tokens": "lots"})["limit_tokens"] is None
+
+def test_estimate_tokens():
+    assert estimate_tokens() == 1
+    assert estimate_tokens("a" * 40, None, "b" * 40) == 21
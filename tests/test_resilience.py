@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from app.connectors.resilience import CircuitBreaker, CircuitOpenError, Resilience, is_outage, is_retryable
+
+class StatusError(Exception):
+    """Stands in for an SDK APIStatusError."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+class APIConnectionError(Exception):
+    """Matched by class name, like either SDK's connection error."""
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def _flaky(*errors, result="ok"):
+    """An attempt that raises the given errors in turn, then returns result; .calls counts attempts."""
+    pending = list(errors)
+
+    async def attempt(*args):
+        attempt.calls += 1
+        if pending:
+            raise pending.pop(0)
+        return result
+    attempt.calls = 0
+    return attempt
+
+def test_retryable_and_outage_classification():
+    assert is_retryable(StatusError(503))
+    assert is_retryable(StatusError(429))
+    assert is_retryable(TimeoutError())
+    assert is_retryable(APIConnectionError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError())
+    assert is_outage(StatusError(529))
+    assert not is_outage(StatusError(429))
+
+def test_breaker_opens_after_threshold_and_probes_after_cooldown():
+    clock = Clock()
+    breaker = CircuitBreaker("test", threshold=2, cooldown=10.0, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 10.0
+    breaker.before_call()  # the probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    assert breaker.snapshot()["rejected_calls"] == 2
+
+def test_failed_probe_reopens_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker("test", threshold=1, cooldown=5.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 5.0
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+    assert breaker.snapshot()["retry_in_s"] == 5.0
+
+def test_abandoned_probe_lets_the_next_call_probe():
+    clock = Clock()
+    breaker = CircuitBreaker("test", threshold=1, cooldown=5.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 5.0
+    breaker.before_call()
+    breaker.abandon_probe()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+def test_zero_threshold_disables_the_breaker():
+    breaker = CircuitBreaker("test", threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == "closed"
+
+def test_retries_transient_errors_until_success():
+    attempt = _flaky(StatusError(503), APIConnectionError())
+    resilience = Resilience("test", max_attempts=3, base_delay=0.0)
+    assert asyncio.run(resilience.call(attempt)) == "ok"
+    assert attempt.calls == 3
+    assert resilience.retries == 2
+    assert resilience.breaker.state == "closed"
+
+def test_client_errors_are_not_retried():
+    attempt = _flaky(StatusError(400))
+    resilience = Resilience("test", base_delay=0.0)
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.call(attempt))
+    assert attempt.calls == 1
+    assert resilience.breaker.failures == 0  # the provider answered
+
+def test_gives_up_after_max_attempts():
+    attempt = _flaky(*(StatusError(502) for _ in range(5)))
+    resilience = Resilience("test", max_attempts=2, base_delay=0.0,
+                            breaker=CircuitBreaker("test", threshold=2))
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.call(attempt))
+    assert attempt.calls == 2
+    assert resilience.breaker.state == "open"
+
+def test_no_retry_once_the_caller_says_so():
+    attempt = _flaky(StatusError(503))
+    resilience = Resilience("test", base_delay=0.0)
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.call(attempt, can_retry=lambda: False))
+    assert attempt.calls == 1
+
+def test_open_breaker_rejects_without_calling():
+    attempt = _flaky()
+    breaker = CircuitBreaker("test", threshold=1, cooldown=60.0)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(Resilience("test", breaker=breaker).call(attempt))
+    assert attempt.calls == 0
+
+def test_deadline_turns_a_slow_call_into_a_timeout():
+    async def slow():
+        await asyncio.sleep(1)
+
+    resilience = Resilience("test", max_attempts=1, deadline=0.05)
+    with pytest.raises(TimeoutError):
+        asyncio.run(resilience.call(slow))
+    assert resilience.deadline_exceeded == 1
+
+def test_admission_wait_does_not_count_against_the_deadline():
+    async def admit():
+        await asyncio.sleep(0.15)
+        return 7
+
+    async def attempt(admitted):
+        await asyncio.sleep(0.02)
+        return admitted
+
+    resilience = Resilience("test", max_attempts=1, deadline=0.1)
+    assert asyncio.run(resilience.call(attempt, admit=admit)) == 7
+    assert resilience.deadline_exceeded == 0
@@ -0,0 +1,101 @@
+import asyncio
+
+from app.connectors.response_cache import ResponseCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_key_covers_every_input():
+    key = ResponseCache.key("openai", "gpt-4o", "system", 0.0, "hello")
+    assert key == ResponseCache.key("openai", "gpt-4o", "system", 0.0, "hello")
+    assert key != ResponseCache.key("openai", "gpt-4o", "system", 0.2, "hello")
+    assert key != ResponseCache.key("anthropic", "gpt-4o", "system", 0.0, "hello")
+    assert key != ResponseCache.key("openai", "gpt-4o", "other system", 0.0, "hello")
+
+def test_sampled_calls_bypass_the_cache_unless_forced():
+    cache = ResponseCache()
+    assert cache.cacheable(0.0)
+    assert not cache.cacheable(0.7)
+    assert cache.stats()["bypassed"] == 1
+    assert ResponseCache(force=True).cacheable(0.7)
+
+def test_least_recently_used_entry_is_evicted():
+    async def main():
+        cache = ResponseCache(max_entries=2)
+        await cache.put("a", "A")
+        await cache.put("b", "B")
+        assert await cache.get("a") == "A"  # "b" is now the oldest
+        await cache.put("c", "C")
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "A"
+        assert await cache.get("c") == "C"
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["hits"] == {"memory": 3, "disk": 0}
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.75
+
+    asyncio.run(main())
+
+def test_entries_expire_after_the_ttl():
+    async def main():
+        clock = Clock()
+        cache = ResponseCache(ttl=60.0, clock=clock)
+        await cache.put("a", "A")
+        clock.now += 59.0
+        assert await cache.get("a") == "A"
+        clock.now += 1.0
+        assert await cache.get("a") is None
+        assert cache.stats()["expired"] == 1
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(main())
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    async def main():
+        path = str(tmp_path / "responses.db")
+        content = {"text": "cached reply", "usage": {"total_tokens": 12}}
+        cache = ResponseCache(path=path)
+        await cache.put("a", content)
+        cache.close()
+
+        cache = ResponseCache(path=path)
+        assert await cache.get("a") == content
+        assert await cache.get("a") == content
+        assert cache.stats()["hits"] == {"memory": 1, "disk": 1}
+        cache.close()
+
+    asyncio.run(main())
+
+def test_expired_disk_entries_are_not_served(tmp_path):
+    async def main():
+        path = str(tmp_path / "responses.db")
+        clock = Clock()
+        cache = ResponseCache(ttl=60.0, path=path, clock=clock)
+        await cache.put("a", "A")
+        await cache.put("b", "B")
+        cache.close()
+
+        clock.now += 120.0
+        cache = ResponseCache(ttl=60.0, path=path, clock=clock)  # swept on open
+        assert cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+        assert await cache.get("a") is None
+        cache.close()
+
+    asyncio.run(main())
+
+def test_unserializable_content_stays_in_memory(tmp_path):
+    async def main():
+        cache = ResponseCache(path=str(tmp_path / "responses.db"))
+        content = {"not json": object()}
+        await cache.put("a", content)
+        assert await cache.get("a") is content
+        assert cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+        cache.close()
+
+    asyncio.run(main())
@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import TurnScheduler
+
+async def _settle():
+    """Let every ready task run until it blocks again."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def _drain(scheduler, turns):
+    """Queue (flow, lane, weight) turns behind a held slot, then record the order they are granted in."""
+    order = []
+
+    async def turn(flow, lane, weight):
+        async with scheduler.turn(flow, lane, weight):
+            order.append(flow)
+
+    await scheduler.acquire("holder")
+    tasks = [asyncio.create_task(turn(*t)) for t in turns]
+    await _settle()
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+def test_cap_limits_concurrent_turns():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=2)
+        await scheduler.acquire("a")
+        await scheduler.acquire("b")
+        waiter = asyncio.create_task(scheduler.acquire("c"))
+        await _settle()
+        assert not waiter.done()
+        assert scheduler.stats()["queued"]["background"] == 1
+
+        scheduler.release()
+        await waiter
+        assert scheduler.active == 2
+        assert scheduler.stats()["granted"]["background"] == 3
+
+    asyncio.run(main())
+
+def test_interactive_lane_goes_first():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        order = await _drain(scheduler, [
+            ("bg1", "background", 1.0),
+            ("bg2", "background", 1.0),
+            ("human", "interactive", 1.0)
+        ])
+        assert order == ["human", "bg1", "bg2"]
+
+    asyncio.run(main())
+
+def test_weighted_fair_share_while_backlogged():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        turns = []
+        for _ in range(6):
+            turns += [("heavy", "background", 2.0), ("light", "background", 1.0)]
+        order = await _drain(scheduler, turns)
+        assert order[:6].count("heavy") == 4
+        assert order[:6].count("light") == 2
+
+    asyncio.run(main())
+
+def test_unknown_lane_is_rejected():
+    async def main():
+        scheduler = TurnScheduler()
+        with pytest.raises(ValueError):
+            await scheduler.acquire("a", lane="urgent")
+        with pytest.raises(ValueError):
+            scheduler.reserve("a", lane="urgent")
+
+    asyncio.run(main())
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await _settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        scheduler.release()
+        assert scheduler.active == 0
+        await asyncio.wait_for(scheduler.acquire("c"), timeout=1)
+
+    asyncio.run(main())
+
+def test_reservation_takes_the_slot_its_flow_releases():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        seen = []
+
+        async def next_turn():
+            seen.append(scheduler.active)
+            return "done"
+
+        async with scheduler.turn("session"):
+            reservation = scheduler.reserve("session")
+            # Parked: it holds no slot and is not queued until the running turn ends
+            assert scheduler.stats()["reserved_turns"] == 1
+            assert scheduler.stats()["queued"]["background"] == 0
+            assert not reservation.future.done()
+
+        assert reservation.future.done()
+        assert scheduler.active == 1
+        assert await scheduler.run("session", next_turn, reservation=reservation) == "done"
+        assert seen == [1]
+        assert scheduler.active == 0
+        assert scheduler.running == {}
+
+    asyncio.run(main())
+
+def test_reservation_of_an_idle_flow_is_granted_at_once():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        reservation = scheduler.reserve("session")
+        assert reservation.future.done()
+        assert scheduler.active == 1
+        assert scheduler.stats()["reserved_turns"] == 0
+
+    asyncio.run(main())
+
+def test_cancelling_a_granted_reservation_returns_its_slot():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        reservation = scheduler.reserve("session")
+        scheduler.cancel_reservation(reservation)
+        assert scheduler.active == 0
+        scheduler.cancel_reservation(reservation)  # a second cancel must not release again
+        assert scheduler.active == 0
+
+    asyncio.run(main())
+
+def test_cancelling_a_parked_reservation_leaves_the_flow_tag_alone():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        async with scheduler.turn("session"):
+            finish = scheduler.flow_finish["session"]
+            reservation = scheduler.reserve("session")
+            scheduler.cancel_reservation(reservation)
+            assert scheduler.flow_finish["session"] == finish
+            assert scheduler.stats()["reserved_turns"] == 0
+        assert scheduler.active == 0
+
+    asyncio.run(main())
+
+def test_run_cancelled_before_its_first_step_does_not_leak_the_slot():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        called = []
+
+        async def call():
+            called.append(True)
+
+        reservation = scheduler.reserve("session")
+        task = asyncio.create_task(scheduler.run("session", call, reservation=reservation))
+        # A task cancelled before it starts never enters run(); the router covers that with a done-callback
+        task.add_done_callback(lambda task: scheduler.cancel_reservation(reservation))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert task.cancelled()
+        assert called == []
+        assert scheduler.active == 0
+        await asyncio.wait_for(scheduler.acquire("other"), timeout=1)
+
+    asyncio.run(main())
+
+def test_run_cancelled_while_its_reservation_is_queued():
+    async def main():
+        scheduler = TurnScheduler(max_concurrent=1)
+        await scheduler.acquire("holder")
+        reservation = scheduler.reserve("session")
+        task = asyncio.create_task(scheduler.run("session", lambda: asyncio.sleep(0), reservation=reservation))
+        await _settle()
+        assert not reservation.future.done()
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        scheduler.release()
+        assert scheduler.active == 0
+        assert scheduler.stats()["queued"]["background"] == 0
+
+    asyncio.run(main())